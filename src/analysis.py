@@ -0,0 +1,177 @@
+from typing import Optional, Tuple
+import numpy as np
+
+# Analysis of recorded trajectories, e.g. the frames of a Recorder: pos and vel are
+# (frames, anchors, 2) arrays sampled every dt seconds, which is sim.timestep * recorder.every.
+# Every function works on all anchors and both axes at once.
+
+# nodes and weights of the gauss-legendre rule the spring laws get integrated with,
+# exact for laws which are polynomials of up to this degree in the stretch
+QUADRATURE = np.polynomial.legendre.leggauss(8)
+# spring evaluations per batch when integrating, bounds the memory used
+BATCH = 1 << 20
+
+# Frequencies in Hz and amplitudes of the spectrum of every anchor and axis, as arrays
+# of shape (frequencies,) and (frequencies, anchors, 2). The mean is taken out and a
+# hann window applied, so the rest position and the ends of the recording don't leak
+# into the other frequencies.
+def spectrum(pos: np.ndarray, dt: float) -> Tuple[np.ndarray, np.ndarray]:
+    frames = len(pos)
+    window = np.hanning(frames)[:, None, None]
+    centered = pos - pos.mean(axis=0)
+    # scaled so a sine of amplitude a peaks at about a
+    amplitude = np.abs(np.fft.rfft(centered * window, axis=0)) * 2 / max(window.sum(), 1)
+    return np.fft.rfftfreq(frames, dt), amplitude
+
+# Frequency in Hz each anchor oscillates at the most along each axis, as an (anchors, 2) array.
+# The peak of the spectrum is refined by a parabola through it and its neighbours, which
+# gets it well below the resolution of 1 / (frames * dt) for clean oscillations.
+# Anchors which didn't move get 0.
+def dominant_frequency(pos: np.ndarray, dt: float) -> np.ndarray:
+    freqs, amplitude = spectrum(pos, dt)
+    if len(freqs) < 3:
+        return np.zeros(pos.shape[1:])
+    # the constant part is left out
+    peak = np.argmax(amplitude[1:], axis=0) + 1
+    inner = np.clip(peak, 1, len(freqs) - 2)
+    left = np.take_along_axis(amplitude, inner[None] - 1, 0)[0]
+    center = np.take_along_axis(amplitude, inner[None], 0)[0]
+    right = np.take_along_axis(amplitude, inner[None] + 1, 0)[0]
+    curvature = left - 2 * center + right
+    offset = np.divide(left - right, 2 * curvature, out=np.zeros_like(center), where=curvature < 0)
+    offset[peak != inner] = 0
+    frequency = (inner + np.clip(offset, -0.5, 0.5)) * (freqs[1] - freqs[0])
+    # anchors which were gone for a while are NaN
+    frequency[center == 0] = 0
+    frequency[np.isnan(pos).any(axis=0)] = np.nan
+    return frequency
+
+# Envelope of the oscillation of every anchor and axis around its mean, the magnitude
+# of the analytic signal, which follows the peaks of a decaying oscillation smoothly
+def envelope(pos: np.ndarray) -> np.ndarray:
+    frames = len(pos)
+    transformed = np.fft.fft(pos - pos.mean(axis=0), axis=0)
+    # keep the positive frequencies, doubled, which makes the signal analytic
+    weights = np.zeros(frames)
+    weights[0] = 1
+    weights[1:(frames + 1) // 2] = 2
+    if frames % 2 == 0:
+        weights[frames // 2] = 1
+    return np.abs(np.fft.ifft(transformed * weights[:, None, None], axis=0))
+
+# Rate in 1/s at which the amplitude of each anchor and axis decays, as an (anchors, 2)
+# array: the amplitude goes like exp(-rate * t), negative rates grow. A line is fit to
+# the log of the envelope, leaving out a tenth at both ends where the envelope of a
+# finite recording bends. Divided by 2 pi times the dominant frequency it is the
+# damping ratio.
+def decay_rate(pos: np.ndarray, dt: float, trim: float = 0.1) -> np.ndarray:
+    frames = len(pos)
+    cut = int(frames * trim)
+    log = np.log(np.maximum(envelope(pos)[cut:frames - cut], 1e-300))
+    if len(log) < 2:
+        return np.zeros(pos.shape[1:])
+    t = np.arange(len(log)) * dt
+    t -= t.mean()
+    slope = np.tensordot(t, log - log.mean(axis=0), axes=1) / (t @ t)
+    return -slope
+
+# Kinetic energy of all anchors in every frame. Anchors which are gone (NaN) don't count.
+def kinetic_energy(vel: np.ndarray, mass: np.ndarray) -> np.ndarray:
+    return 0.5 * np.nansum(mass * np.einsum("fij,fij->fi", vel, vel), axis=1)
+
+# Potential energy of all anchors in gravity in every frame, zero at the origin.
+# Static anchors don't move, so they only add a constant and are left out.
+def gravity_energy(pos: np.ndarray, mass: np.ndarray, gravity, static: Optional[np.ndarray] = None) -> np.ndarray:
+    weight = mass if static is None else np.where(static, 0, mass)
+    return -np.nansum(weight * (pos @ np.asarray(gravity, dtype=np.float64)), axis=1)
+
+# Energy stored in every spring in every frame, a (frames, springs) array, found by
+# integrating the magnitude of its law from the reference distance to its length.
+# pos holds the anchors in the row order of the engine, see in_rows. The reference defaults to the
+# rest length, laws which can't be integrated from there, like the hyperbolic one,
+# need another, e.g. the lengths of the first frame.
+def spring_energy(engine, pos: np.ndarray, reference: Optional[np.ndarray] = None) -> np.ndarray:
+    m = engine.springs.size
+    start, end = engine.springs.start[:m], engine.springs.end[:m]
+    delta = np.take(pos, end, axis=1) - np.take(pos, start, axis=1)
+    dist = np.hypot(delta[..., 0], delta[..., 1])
+    if reference is None:
+        reference = engine.springs.rest_length[:m]
+    nodes, weights = QUADRATURE
+    energy = np.zeros(dist.shape)
+    # a batch of frames at a time, all nodes of the rule at once
+    batch = max(1, BATCH // max(m * len(nodes), 1))
+    for first in range(0, len(dist), batch):
+        span = dist[first:first + batch] - reference
+        # the nodes mapped from [-1, 1] onto [reference, dist]
+        at = reference + span * (nodes[:, None, None] + 1) / 2
+        energy[first:first + batch] = span / 2 * np.tensordot(weights, engine.magnitudes(at), axes=1)
+    return energy
+
+# Rearranges recorded columns of the anchors with the given uids, e.g. the pos of the
+# frames of a Recorder, into the row order of the engine. Anchors which weren't
+# recorded are NaN, and so don't count towards the energies.
+def in_rows(engine, uids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    n = engine.anchors.size
+    uid = engine.anchors.uid[:n]
+    result = np.full((len(values), n, *values.shape[2:]), np.nan)
+    if len(uids) == 0:
+        return result
+    order = np.argsort(uids)
+    at = order[np.minimum(np.searchsorted(uids, uid, sorter=order), len(uids) - 1)]
+    found = uids[at] == uid
+    result[:, found] = values[:, at[found]]
+    return result
+
+# Kinetic, gravity, spring and total energy of the scene in every frame, given the
+# positions and velocities of all anchors of the engine in its row order, or of
+# the anchors with the given uids, e.g. recorder.uids
+def energy(engine, pos: np.ndarray, vel: np.ndarray, gravity=None, uids: Optional[np.ndarray] = None,
+           reference: Optional[np.ndarray] = None) -> dict:
+    if uids is not None:
+        pos, vel = in_rows(engine, uids, pos), in_rows(engine, uids, vel)
+    n = engine.anchors.size
+    mass = engine.anchors.mass[:n]
+    kinetic = kinetic_energy(vel, mass)
+    potential = np.zeros(len(pos)) if gravity is None else gravity_energy(pos, mass, gravity, engine.anchors.static[:n])
+    springs = np.nansum(spring_energy(engine, pos, reference), axis=1)
+    return {
+        "kinetic": kinetic,
+        "gravity": potential,
+        "spring": springs,
+        "total": kinetic + potential + springs,
+    }
+
+# The last positions of one anchor for a live plot. Every sample is written twice
+# into a buffer of twice the capacity, so the newest samples always are one
+# contiguous slice and adding one costs the same however long the trace.
+class Trace:
+    uid: int
+    capacity: int
+    # samples added so far
+    count: int
+
+    def __init__(self, uid: int, capacity: int = 200):
+        self.uid = uid
+        self.capacity = capacity
+        self.samples = np.full((2 * capacity, 2), np.nan)
+        self.count = 0
+        # row of the anchor in the snapshot the last time it was looked up
+        self.row = -1
+
+    # Adds the position of the anchor in a snapshot, if it made it into it
+    def capture(self, uid: np.ndarray, pos: np.ndarray):
+        row = self.row
+        if not (0 <= row < len(uid) and uid[row] == self.uid):
+            rows = np.flatnonzero(uid == self.uid)
+            if len(rows) == 0:
+                return
+            row = self.row = int(rows[0])
+        index = self.count % self.capacity
+        self.samples[index] = self.samples[index + self.capacity] = pos[row]
+        self.count += 1
+
+    # The samples still kept, newest first, as a view
+    def latest(self) -> np.ndarray:
+        end = self.count % self.capacity + self.capacity
+        return self.samples[end - min(self.count, self.capacity):end][::-1]
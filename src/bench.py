@@ -0,0 +1,184 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from typing import Callable, Dict, List, Tuple
+from sim import Simulation, HookesSpring, QuadraticSpring, ConstantSpring, HyperbolicSpring
+from render import Render, Camera
+from grid import Grid, render_grid
+from draw import draw_springs, draw_anchors
+from spatial import Picker
+import generators
+import pygame
+import numpy as np
+import argparse
+import json
+import platform
+import sys
+import time
+
+SPRING_TYPES = [HookesSpring, QuadraticSpring, ConstantSpring, HyperbolicSpring]
+# distance between neighbouring anchors of the generated scenes
+SPACING = 0.3
+# largest width of a generated scene, so it stays well inside the simulated area
+EXTENT = 60
+SCREEN_SIZE = (1280, 720)
+
+def side(n: int) -> int:
+    return max(2, int(np.ceil(np.sqrt(n))))
+
+# Spacing of a generated scene with the given number of anchors per side
+def spacing(cells: int) -> float:
+    return min(SPACING, EXTENT / cells)
+
+# The spring types take turns and the springs rest at zero length, the scene is held
+# in place at its first anchor
+PARAMS = {"spring": SPRING_TYPES, "stiffness": 10, "rest_length": 0, "pinned": (0,)}
+
+# n anchors each connected to the next, winding back and forth over a square
+def chain(sim: Simulation, n: int, rng: np.random.Generator):
+    cells = side(n)
+    return generators.chain(sim, n - 1, (-(cells - 1) / 2 * spacing(cells), (cells - 1) / 2 * spacing(cells)),
+                            spacing(cells), row_length=cells, **PARAMS)
+
+# about n anchors in a square grid, each connected to its right and lower neighbour
+def lattice(sim: Simulation, n: int, rng: np.random.Generator):
+    cells = side(n)
+    return generators.lattice(sim, cells, cells, spacing=spacing(cells), **PARAMS)
+
+# about n anchors in a square cloth, with shear springs across every cell
+def cloth(sim: Simulation, n: int, rng: np.random.Generator):
+    cells = side(n)
+    return generators.cloth(sim, cells, cells, spacing=spacing(cells), **PARAMS)
+
+# n anchors scattered over a square, with 2n springs between random pairs of them
+def random_graph(sim: Simulation, n: int, rng: np.random.Generator):
+    cells = side(n)
+    return generators.random_graph(sim, n, size=cells * spacing(cells), seed=rng, **PARAMS)
+
+SCENES: Dict[str, Callable[[Simulation, int, np.random.Generator], Tuple[np.ndarray, np.ndarray]]] = {
+    "chain": chain,
+    "lattice": lattice,
+    "cloth": cloth,
+    "random": random_graph,
+}
+
+# Runs fn repeatedly and returns statistics of its duration
+def measure(fn: Callable[[], None], repeats: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return {
+        "repeats": repeats,
+        "mean_ms": float(times.mean()),
+        "median_ms": float(np.median(times)),
+        "min_ms": float(times.min()),
+        "max_ms": float(times.max()),
+    }
+
+# A camera showing the whole scene
+def fit_camera(pos: np.ndarray) -> Camera:
+    lo, hi = pos.min(axis=0), pos.max(axis=0)
+    extent = max(float((hi - lo).max()), SPACING)
+    return Camera(((lo + hi) / 2).tolist(), 1 / extent)
+
+# Times the step, drawing and picking of one scene
+def benchmark(name: str, n: int, repeats: int, slow_repeats: int, seed: int) -> List[dict]:
+    rng = np.random.default_rng(seed)
+    sim = Simulation()
+    sim.clear()
+    SCENES[name](sim, n, rng)
+    info = {"scene": name, "anchors": sim.engine.anchors.size, "springs": sim.engine.springs.size}
+    results = []
+
+    def add(benchmark: str, fn: Callable[[], None], repeats: int):
+        results.append({**info, "benchmark": benchmark, **measure(fn, repeats)})
+
+    sim.publish()
+    snapshot = sim.snapshot
+    render = Render(pygame.Surface(SCREEN_SIZE), fit_camera(snapshot.pos))
+    grid = Grid()
+
+    def draw():
+        render.screen.fill("black")
+        draw_springs(render, snapshot)
+        draw_anchors(render, snapshot)
+
+    add("draw", draw, repeats)
+    add("grid", lambda: Grid().draw(render), repeats)
+    add("render_grid", lambda: render_grid(render), repeats)
+
+    def pan():
+        render.camera.pos += pygame.Vector2(1, 1) / (render.pixels * render.camera.zoom)
+        grid.draw(render)
+
+    add("grid_pan", pan, repeats)
+
+    # the same points for every repeat, so the timings are comparable
+    points = [pygame.Vector2(rng.uniform(0, SCREEN_SIZE[0]), rng.uniform(0, SCREEN_SIZE[1]))
+              for _ in range(max(repeats, slow_repeats) + 1)]
+    picker = Picker()
+    picker.update(snapshot)
+    clicks = iter(points * 2)
+    add("pick", lambda: picker.pick(render.untransform_point(next(clicks))), repeats)
+
+    def pick_index():
+        picker.indexed = None
+        picker.pick(render.untransform_point(points[0]))
+
+    add("pick_index", pick_index, repeats)
+
+    entities = sim.entities
+    clicks = iter(points * 2)
+
+    def clicked():
+        point = next(clicks)
+        for entity in entities:
+            if entity.clicked(render, point):
+                break
+
+    add("clicked", clicked, slow_repeats)
+
+    add("update", sim.update, repeats)
+    sim.vectorized = False
+    add("update_scalar", sim.update, slow_repeats)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stepping, drawing and picking on synthetic scenes")
+    parser.add_argument("--scenes", nargs="+", choices=list(SCENES), default=list(SCENES), help="scenes to generate")
+    parser.add_argument("--anchors", nargs="+", type=int, default=[100, 1000, 10000], help="scene sizes")
+    parser.add_argument("--repeats", type=int, default=20, help="runs of each fast benchmark")
+    parser.add_argument("--slow-repeats", type=int, default=3, help="runs of the per object benchmarks")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random scenes")
+    parser.add_argument("--output", "-o", help="where to write the results to (.json), default stdout")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenes:
+        for n in args.anchors:
+            for result in benchmark(name, n, args.repeats, args.slow_repeats, args.seed):
+                print(f"{result['scene']:>8} {result['anchors']:>8} anchors {result['benchmark']:>14} "
+                      f"{result['median_ms']:10.3f}ms", file=sys.stderr)
+                results.append(result)
+
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pygame.version.ver,
+        "results": results,
+    }
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+from collections import deque
+from typing import Any, Dict, Iterator, Optional, Tuple
+import numpy as np
+
+# steps between two checkpoints taken while simulating
+EVERY = 100
+# checkpoints kept at most, the oldest get dropped first
+CAPACITY = 64
+# bytes of copied columns kept at most
+MAX_BYTES = 256 << 20
+
+# The full state of a simulation after a step: copies of all engine columns and
+# the settings and integrator state stepping depends on, so simulating on from
+# a restored checkpoint gives the same steps again.
+class Checkpoint:
+    # number of steps simulated when it was taken
+    step: int
+    # columns and next uid of the anchor and spring tables, see Table.state
+    anchors: Tuple[Dict[str, np.ndarray], int]
+    springs: Tuple[Dict[str, np.ndarray], int]
+    # gravity, timestep and the other settings of the simulation
+    settings: Dict[str, Any]
+    # copies of the integrator and the islands, which carry state over between steps
+    integrator: Any
+    islands: Any
+
+    def __init__(self, step: int, anchors, springs, settings: Dict[str, Any], integrator, islands):
+        self.step = step
+        self.anchors = anchors
+        self.springs = springs
+        self.settings = settings
+        self.integrator = integrator
+        self.islands = islands
+
+    # bytes taken by the copied columns
+    def nbytes(self) -> int:
+        return sum(column.nbytes for table in (self.anchors, self.springs) for column in table[0].values())
+
+# A bounded ring of checkpoints in the order they were taken, the oldest
+# dropped once there are more than capacity or they take more than max_bytes
+class Checkpoints:
+    # steps between two checkpoints, 0 to only take them by hand
+    every: int
+    capacity: int
+    max_bytes: int
+
+    def __init__(self, every: int = EVERY, capacity: int = CAPACITY, max_bytes: int = MAX_BYTES):
+        self.every = every
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.ring = deque()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.ring)
+
+    def __iter__(self) -> Iterator[Checkpoint]:
+        return iter(self.ring)
+
+    # Whether a checkpoint of the state at the given step is due, the first one
+    # right away so there always is one to go back to
+    def due(self, step: int) -> bool:
+        if self.every <= 0:
+            return False
+        if not self.ring:
+            return True
+        return step % self.every == 0 and self.ring[-1].step != step
+
+    def add(self, checkpoint: Checkpoint):
+        self.ring.append(checkpoint)
+        self.bytes += checkpoint.nbytes()
+        # the newest one is kept in any case
+        while len(self.ring) > 1 and (len(self.ring) > self.capacity or self.bytes > self.max_bytes):
+            self.bytes -= self.ring.popleft().nbytes()
+
+    # The newest checkpoint taken at or before the given step, None if there is none
+    def before(self, step: int) -> Optional[Checkpoint]:
+        for checkpoint in reversed(self.ring):
+            if checkpoint.step <= step:
+                return checkpoint
+        return None
+
+    # Drops the checkpoints taken after the given step, e.g. after rewinding,
+    # as simulating on from there need not lead to them anymore
+    def truncate(self, step: int):
+        while self.ring and self.ring[-1].step > step:
+            self.bytes -= self.ring.pop().nbytes()
+
+    def clear(self):
+        self.ring.clear()
+        self.bytes = 0
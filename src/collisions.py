@@ -0,0 +1,109 @@
+from typing import Tuple
+import numpy as np
+
+# Pairs (i, j) of anchors whose cells of a uniform grid touch, each pair once.
+# The cells are as wide as the largest anchor, so all touching anchors are among
+# the pairs and crowded anchors only get compared with their few neighbours.
+def candidate_pairs(pos: np.ndarray, radius: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    n = len(pos)
+    empty = np.zeros(0, dtype=np.intp)
+    if n < 2:
+        return empty, empty
+    cell_size = 2 * float(radius.max())
+    if cell_size <= 0:
+        return empty, empty
+
+    cell = np.floor(pos / cell_size).astype(np.int64)
+    cell -= cell.min(axis=0)
+    # a spare row on both sides keeps neighbour keys from wrapping into the next column
+    stride = int(cell[:, 1].max()) + 3
+    key = cell[:, 0] * stride + cell[:, 1] + 1
+    order = np.argsort(key, kind="stable")
+    keys = key[order]
+
+    # Every anchor gets compared with half of its 3x3 neighbourhood, so each pair
+    # of neighbouring cells is visited once: the anchors after it in its own cell
+    # and the cell above, which follow each other in key order, and the three
+    # cells of the next column, which do too.
+    ranges = [
+        (np.arange(1, n + 1), np.searchsorted(keys, keys + 1, "right")),
+        (np.searchsorted(keys, keys + stride - 1, "left"), np.searchsorted(keys, keys + stride + 1, "right")),
+    ]
+    firsts, seconds = [], []
+    for start, end in ranges:
+        counts = np.maximum(end - start, 0)
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        first = np.repeat(np.arange(n), counts)
+        # position of every pair within the run of its first anchor
+        offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        firsts.append(order[first])
+        seconds.append(order[np.repeat(start, counts) + offset])
+    if not firsts:
+        return empty, empty
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+# Separates overlapping anchors and bounces them off each other in place.
+# coef is the inverse mass, zero for anchors which must not be moved. The
+# velocity along the contact normal of approaching anchors is reversed and
+# scaled by the restitution, 0 for sticking together and 1 for elastic bounces.
+# Every iteration resolves all contacts at once, more of them settle piles
+# where anchors push each other, towards the speed of separation set by the
+# restitution when a pair first touched. Returns the pairs which touched.
+def collide(pos: np.ndarray, vel: np.ndarray, radius: np.ndarray, coef: np.ndarray,
+            restitution: float, iterations: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+    n = len(pos)
+    i, j = candidate_pairs(pos, radius)
+    if len(i) == 0:
+        return i, j
+    # pairs of which neither anchor can move are left alone
+    weight = coef[i] + coef[j]
+    movable = weight > 0
+    i, j, weight = i[movable], j[movable], weight[movable]
+    reach = radius[i] + radius[j]
+    reach_squared = reach * reach
+    # speed along the normal each pair separates with, set when it first touches
+    target = np.full(len(i), np.nan)
+
+    contacts = np.zeros(len(i), dtype=np.bool_)
+    for _ in range(iterations):
+        # np.take is much faster than indexing rows of a 2d array
+        delta = np.take(pos, j, axis=0) - np.take(pos, i, axis=0)
+        touching = np.flatnonzero(np.einsum("ij,ij->i", delta, delta) < reach_squared)
+        if len(touching) == 0:
+            break
+        a, b, w = i[touching], j[touching], weight[touching]
+        contacts[touching] = True
+        normal = np.take(delta, touching, axis=0)
+        d = np.hypot(normal[:, 0], normal[:, 1])
+        on_top = d == 0
+        if on_top.any():
+            # anchors on top of each other get pushed apart along x
+            normal[on_top] = (1, 0)
+            d[on_top] = 1
+            normal /= d[:, None]
+            d[on_top] = 0
+        else:
+            normal /= d[:, None]
+
+        # move both anchors apart in proportion to their inverse mass
+        push = (np.take(reach, touching) - d) / w
+        # relative velocity along the normal, negative while approaching
+        relative = np.take(vel, b, axis=0) - np.take(vel, a, axis=0)
+        approach = relative[:, 0] * normal[:, 0] + relative[:, 1] * normal[:, 1]
+        separation = np.take(target, touching)
+        new = np.isnan(separation)
+        separation[new] = -restitution * np.minimum(approach[new], 0)
+        target[touching] = separation
+        impulse = np.maximum(separation - approach, 0) / w
+        # anchors touching several others move by the mean of their pushes, adding
+        # them up would overshoot in piles. The impulses do add up, they only ever
+        # take away approach speed, and a pile has to carry all of its weight.
+        share = coef / np.maximum(np.bincount(a, minlength=n) + np.bincount(b, minlength=n), 1)
+        for axis in range(2):
+            moved = push * normal[:, axis]
+            pos[:, axis] += share * (np.bincount(b, moved, n) - np.bincount(a, moved, n))
+            bounced = impulse * normal[:, axis]
+            vel[:, axis] += coef * (np.bincount(b, bounced, n) - np.bincount(a, bounced, n))
+    return i[contacts], j[contacts]
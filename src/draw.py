@@ -0,0 +1,188 @@
+from render import Render
+from snapshot import Snapshot
+from analysis import Trace
+import pygame
+import numpy as np
+
+SPRING_WIDTH = 0.2
+SPRING_SEGS = 20
+# springs shorter than this many pixels on screen are drawn as straight lines
+SPRING_LOD = 2 * SPRING_SEGS
+# thin springs shorter than this many pixels are drawn as a row of pixels
+SPRING_DOT_LOD = 8
+# anchors with a smaller radius in pixels are drawn as stamps of pixels
+ANCHOR_LOD = 2.5
+# meters a trace moves on per sample
+TRACE_STEP = 1 / 300
+
+def anchor_color(selected: bool, static: bool):
+    if selected:
+        return (0, 255, 100)
+    elif static:
+        return (150, 150, 150)
+    else:
+        return (255, 255, 255)
+
+def spring_color(selected: bool, stiffness: float):
+    if selected:
+        return (0, 255, 100)
+    elif stiffness < 0:
+        return (232, 38, 4)
+    else:
+        return (237, 248, 100)
+
+# zigzag of a spring from (0, 0) to (1, 0) as (along, across) offsets,
+# shared by all springs and frames
+SPRING_TEMPLATE = np.zeros((SPRING_SEGS + 1, 2))
+SPRING_TEMPLATE[:, 0] = np.arange(SPRING_SEGS + 1) / SPRING_SEGS
+SPRING_TEMPLATE[1:-1:2, 1] = -SPRING_WIDTH
+SPRING_TEMPLATE[2:-1:2, 1] = SPRING_WIDTH
+
+# screen coords of the zigzags of all springs, (springs, SPRING_SEGS + 1, 2)
+def spring_vertices(render: Render, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    delta = end - start
+    dist = np.hypot(delta[:, 0], delta[:, 1])
+    normal = np.stack([-delta[:, 1], delta[:, 0]], axis=1) / dist[:, None]
+    along = SPRING_TEMPLATE[None, :, 0, None] * delta[:, None, :]
+    across = SPRING_TEMPLATE[None, :, 1, None] * normal[:, None, :]
+    points = start[:, None, :] + along + across
+    return render.transform_points(points.reshape(-1, 2)).reshape(points.shape)
+
+# Draws a zigzag line between start and end
+def draw_spring(render: Render, color, start: pygame.Vector2, end: pygame.Vector2):
+    if start == end:
+        return
+    points = spring_vertices(render, np.array([tuple(start)]), np.array([tuple(end)]))[0]
+    pygame.draw.lines(render.screen, color, False, points.tolist(), int(render.transform_size(0.05)))
+
+# Mask of the springs whose zigzag might reach into the visible world rect
+def springs_visible(render: Render, start: np.ndarray, end: np.ndarray, length: np.ndarray) -> np.ndarray:
+    lo, hi = render.visible_rect()
+    # the zigzag reaches SPRING_WIDTH * length to both sides of the spring
+    pad = SPRING_WIDTH * length
+    visible = length > 0
+    for axis in range(2):
+        visible &= np.minimum(start[:, axis], end[:, axis]) - pad <= hi[axis]
+        visible &= np.maximum(start[:, axis], end[:, axis]) + pad >= lo[axis]
+    return visible
+
+def draw_springs(render: Render, snapshot: Snapshot):
+    start = snapshot.pos[snapshot.start]
+    end = snapshot.pos[snapshot.end]
+    length = np.hypot(*(end - start).T)
+    visible = np.flatnonzero(springs_visible(render, start, end, length))
+    if len(visible) == 0:
+        return
+    width = int(render.transform_size(0.05))
+    screen_length = length[visible] * render.pixels * render.camera.zoom
+    # 0 pulling, 1 pushing, 2 selected
+    kinds = np.where(snapshot.spring_selected[visible], 2, snapshot.stiffness[visible] < 0)
+    colors = [spring_color(False, 1), spring_color(False, -1), spring_color(True, 1)]
+
+    # springs too short on screen for their zigzag to be seen are drawn as straight lines,
+    # thin lines only a few pixels long as pixels set all at once
+    zigzags = np.flatnonzero(screen_length >= SPRING_LOD)
+    dots = np.flatnonzero((screen_length < SPRING_DOT_LOD) & (width <= 1))
+    lines = np.flatnonzero((screen_length < SPRING_LOD) & ((screen_length >= SPRING_DOT_LOD) | (width > 1)))
+
+    if len(zigzags):
+        vertices = spring_vertices(render, start[visible[zigzags]], end[visible[zigzags]]).tolist()
+        for kind, points in zip(kinds[zigzags].tolist(), vertices):
+            pygame.draw.lines(render.screen, colors[kind], False, points, width)
+
+    if len(lines):
+        points = np.stack([start[visible[lines]], end[visible[lines]]], axis=1)
+        points = render.transform_points(points.reshape(-1, 2)).reshape(points.shape).tolist()
+        for kind, (a, b) in zip(kinds[lines].tolist(), points):
+            pygame.draw.line(render.screen, colors[kind], a, b, max(width, 1))
+
+    if len(dots):
+        a = render.transform_points(start[visible[dots]])
+        b = render.transform_points(end[visible[dots]])
+        # about one pixel per sample
+        t = np.linspace(0, 1, int(np.ceil(screen_length[dots].max())) + 1)[None, :, None]
+        points = a[:, None] + t * (b - a)[:, None]
+        draw_points(render, points.reshape(-1, 2), np.repeat(kinds[dots], t.shape[1]), colors)
+
+# pixel offsets of a disc with a radius of 0, 1 and 2 pixels
+ANCHOR_STAMPS = [
+    np.array([(x, y) for x in range(-size, size + 1) for y in range(-size, size + 1) if x * x + y * y <= size * size])
+    for size in range(3)
+]
+
+def draw_anchors(render: Render, snapshot: Snapshot):
+    lo, hi = render.visible_rect()
+    radius = snapshot.radius
+    visible = np.ones(snapshot.n_anchors, dtype=bool)
+    for axis in range(2):
+        visible &= snapshot.pos[:, axis] + radius >= lo[axis]
+        visible &= snapshot.pos[:, axis] - radius <= hi[axis]
+    visible = np.flatnonzero(visible)
+    if len(visible) == 0:
+        return
+    centers = render.transform_points(snapshot.pos[visible])
+    radii = snapshot.radius[visible] * render.pixels * render.camera.zoom
+    selected = snapshot.anchor_selected[visible]
+    static = snapshot.static[visible]
+
+    # anchors only a few pixels large are stamped into the screen all at once
+    small = radii < ANCHOR_LOD
+    if small.any():
+        # 0 plain, 1 static, 2 selected
+        kinds = np.where(selected[small], 2, static[small])
+        sizes = np.rint(radii[small]).astype(np.intp)
+        points, point_kinds = [], []
+        for size, stamp in enumerate(ANCHOR_STAMPS):
+            of_size = sizes == size
+            points.append((centers[small][of_size][:, None] + stamp).reshape(-1, 2))
+            point_kinds.append(np.repeat(kinds[of_size], len(stamp)))
+        colors = [anchor_color(False, False), anchor_color(False, True), anchor_color(True, False)]
+        draw_points(render, np.concatenate(points), np.concatenate(point_kinds), colors)
+
+    large = np.flatnonzero(~small)
+    for center, radius, is_selected, is_static in zip(centers[large].tolist(), radii[large].tolist(),
+            selected[large].tolist(), static[large].tolist()):
+        pygame.draw.circle(render.screen, anchor_color(is_selected, is_static), center, radius)
+
+# Sets the pixels at the given screen coords to colors[kind],
+# where points share a pixel the one with the highest kind ends up on top
+def draw_points(render: Render, points: np.ndarray, kinds: np.ndarray, colors: list):
+    width, height = render.screen.get_size()
+    x, y = points.T
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    # inside the screen truncating rounds down
+    x = x[inside].astype(np.intp)
+    y = y[inside].astype(np.intp)
+    kinds = kinds[inside]
+
+    screen = pygame.surfarray.pixels2d(render.screen)
+    for kind, color in enumerate(colors):
+        of_kind = kinds == kind
+        screen[x[of_kind], y[of_kind]] = render.screen.map_rgb(color)
+    del screen
+
+# Draws lines of text below each other on a dark background, top left at pos
+def draw_text(screen: pygame.Surface, font: pygame.font.Font, lines: list, pos):
+    surfaces = [font.render(line, True, (230, 230, 230)) for line in lines]
+    if not surfaces:
+        return
+    height = font.get_linesize()
+    background = pygame.Surface((max(s.get_width() for s in surfaces) + 8, height * len(surfaces) + 8))
+    background.set_alpha(180)
+    screen.blit(background, pos)
+    for i, surface in enumerate(surfaces):
+        screen.blit(surface, (pos[0] + 4, pos[1] + 4 + i * height))
+
+# Plots the x (red) and y (blue) position of a traced anchor over time, the
+# newest samples at its current position moving away along the other axis
+def draw_trace(render: Render, trace: Trace):
+    points = trace.latest()
+    if len(points) <= 2:
+        return
+    age = np.arange(len(points)) * TRACE_STEP
+    x_trace = render.transform_points(np.stack([points[:, 0], age], axis=1))
+    y_trace = render.transform_points(np.stack([age, points[:, 1]], axis=1))
+    pygame.draw.lines(render.screen, (255, 0, 0), False, x_trace)
+    render.draw_vline((255, 0, 0), points[0, 0])
+    pygame.draw.lines(render.screen, (0, 0, 255), False, y_trace)
+    render.draw_hline((0, 0, 255), points[0, 1])
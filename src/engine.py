@@ -0,0 +1,528 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from profiler import Profiler
+import collisions
+import numpy as np
+import threading
+
+# radius of an anchor with a mass of one kilogram
+SIZE_RATIO = 0.10876
+# anchors whose squared distance to the origin exceeds this get removed
+BOUNDS = 2000
+
+# names of the spring laws which have a vectorized force kernel, indexed by their law id
+LAWS: List[str] = []
+# the force kernels of the laws, magnitude of the force given arrays of distances and stiffnesses
+KERNELS: List[Callable[[np.ndarray, np.ndarray], np.ndarray]] = []
+# whether each law is measured from the rest length of its springs. The others get the
+# distance between the anchors, so their springs have no rest length.
+STRETCHED: List[bool] = []
+# law id of springs whose magnitude has to be evaluated one by one
+LAW_CUSTOM = -1
+
+# Adds a vectorized spring law and returns its id. Registering a name again
+# replaces its kernel and keeps the id. Laws measured from a rest length get the
+# stretch, which is negative when compressed, and have to be odd in it, so
+# compressed springs push their anchors apart.
+def register_law(name: str, kernel: Callable[[np.ndarray, np.ndarray], np.ndarray], stretched: bool = True) -> int:
+    if name in LAWS:
+        law = LAWS.index(name)
+        KERNELS[law] = kernel
+        STRETCHED[law] = stretched
+        return law
+    # the law column is an int8
+    if len(LAWS) >= 127:
+        raise ValueError("too many spring laws")
+    LAWS.append(name)
+    KERNELS.append(kernel)
+    STRETCHED.append(stretched)
+    return len(LAWS) - 1
+
+register_law("hooke", lambda stretch, stiffness: stretch * stiffness)
+register_law("quadratic", lambda stretch, stiffness: np.abs(stretch) * stretch * stiffness)
+register_law("constant", lambda stretch, stiffness: np.sign(stretch) * stiffness)
+# a rest length would put its pole where the spring is meant to rest
+register_law("hyperbolic", lambda dist, stiffness: stiffness / dist, stretched=False)
+
+# A growable set of equally long numpy columns, one row per entity
+class Table:
+    size: int
+    capacity: int
+    columns: Dict[str, Tuple[type, tuple]]
+    # the python objects viewing the rows, one per row. Rows added in bulk
+    # have None until their view is first asked for through view()
+    views: List[Optional[object]]
+    # creates the view of the row at the given index
+    factory: Optional[Callable[[int], object]]
+    # unique id given to the next row, ids stay the same when rows move
+    next_uid: int
+    # changes whenever rows get added or removed
+    version: int
+
+    def __init__(self, capacity=16, **columns):
+        self.size = 0
+        self.capacity = capacity
+        self.columns = {}
+        self.views = []
+        self.factory = None
+        self.next_uid = 0
+        self.version = 0
+        columns["uid"] = np.int64
+        for name, column in columns.items():
+            dtype, shape = column if isinstance(column, tuple) else (column, ())
+            self.columns[name] = (dtype, shape)
+            setattr(self, name, np.zeros((capacity, *shape), dtype=dtype))
+
+    def reserve(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        while self.capacity < capacity:
+            self.capacity *= 2
+        for name, (dtype, shape) in self.columns.items():
+            column = np.zeros((self.capacity, *shape), dtype=dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+
+    # Appends a zeroed row and returns its index
+    def add(self, view=None, uid=None) -> int:
+        self.reserve(self.size + 1)
+        index = self.size
+        for name in self.columns:
+            getattr(self, name)[index] = 0
+        if uid is None:
+            uid = self.next_uid
+        self.next_uid = max(self.next_uid, uid + 1)
+        self.uid[index] = uid
+        self.views.append(view)
+        self.size += 1
+        self.version += 1
+        return index
+
+    # Appends count rows with the given column values and returns the index of the first,
+    # the views of the new rows get created when they are first needed
+    def extend(self, count: int, **values) -> int:
+        self.reserve(self.size + count)
+        index = self.size
+        for name in self.columns:
+            getattr(self, name)[index:index + count] = values.get(name, 0)
+        self.uid[index:index + count] = np.arange(self.next_uid, self.next_uid + count)
+        self.next_uid += count
+        self.views.extend([None] * count)
+        self.size += count
+        self.version += 1
+        return index
+
+    def view(self, index: int) -> object:
+        view = self.views[index]
+        if view is None:
+            view = self.views[index] = self.factory(index)
+        return view
+
+    # The views of all rows, creating the missing ones
+    def all_views(self) -> List[object]:
+        for index, view in enumerate(self.views):
+            if view is None:
+                self.views[index] = self.factory(index)
+        return self.views
+
+    # Removes the rows at the given indices and returns the index every row moved
+    # to, -1 for the removed ones. The removed rows get marked and all others shifted
+    # to the front in one pass, so removing many rows at once costs about as much
+    # as removing one.
+    def remove_rows(self, rows) -> np.ndarray:
+        keep = np.ones(self.size, dtype=np.bool_)
+        keep[rows] = False
+        moved = np.cumsum(keep) - 1
+        moved[~keep] = -1
+        removed = np.flatnonzero(~keep)
+        if len(removed) == 0:
+            return moved
+        first = int(removed[0])
+        kept = keep[first:]
+        for name in self.columns:
+            column = getattr(self, name)
+            rest = column[first:self.size][kept]
+            column[first:first + len(rest)] = rest
+        views = [view for view, k in zip(self.views[first:], kept.tolist()) if k]
+        self.views[first:] = views
+        self.size -= len(removed)
+        self.version += 1
+        for index, view in enumerate(views, first):
+            if view is not None:
+                view._index = index
+        return moved
+
+    # Row of the given uid, None if there is none
+    def find(self, uid: int):
+        rows = np.flatnonzero(self.uid[:self.size] == uid)
+        return int(rows[0]) if len(rows) else None
+
+    def clear(self):
+        self.size = 0
+        self.views = []
+        self.version += 1
+
+    # Copies of all rows and the next uid, see load
+    def state(self) -> Tuple[Dict[str, np.ndarray], int]:
+        return {name: getattr(self, name)[:self.size].copy() for name in self.columns}, self.next_uid
+
+    # Replaces all rows with the ones of a state. Views of rows whose uid is in
+    # the state move along with their row, the others get dropped.
+    def load(self, state: Tuple[Dict[str, np.ndarray], int]):
+        columns, next_uid = state
+        views = {uid: view for uid, view in zip(self.uid[:self.size].tolist(), self.views) if view is not None}
+        size = len(columns["uid"])
+        self.reserve(size)
+        for name in self.columns:
+            getattr(self, name)[:size] = columns[name]
+        self.size = size
+        self.next_uid = next_uid
+        self.version += 1
+        self.views = [views.get(uid) for uid in columns["uid"].tolist()]
+        for index, view in enumerate(self.views):
+            if view is not None:
+                view._index = index
+
+# Structure-of-arrays storage of all anchors and springs of a simulation
+# together with the batched force and integration kernels working on them
+class Engine:
+    anchors: Table
+    springs: Table
+    # number of force evaluations so far
+    evaluations: int
+    profiler: Profiler
+    # called with (table, index, column) when a field of an entity gets set
+    on_edit: Optional[Callable[[Table, int, str], None]]
+    # whether what the kernels look up every step is kept between steps, see hold
+    holding: bool
+    # held while the rows move or get written, e.g. by the entities, see sim.Field
+    lock: threading.RLock
+
+    def __init__(self):
+        self.evaluations = 0
+        self.profiler = Profiler()
+        self.on_edit = None
+        self.lock = threading.RLock()
+        self.holding = False
+        self.held = None
+        # (versions of the tables, offsets, spring rows), see adjacency
+        self.adjacent = None
+        self.anchors = Table(
+            pos=(np.float64, (2,)),
+            vel=(np.float64, (2,)),
+            mass=np.float64,
+            # inverse mass, zero for static or locked anchors
+            coef=np.float64,
+            radius=np.float64,
+            static=np.bool_,
+            locked=np.bool_,
+            selected=np.bool_,
+        )
+        self.springs = Table(
+            start=np.intp,
+            end=np.intp,
+            law=np.int8,
+            stiffness=np.float64,
+            # distance at which the spring applies no force
+            rest_length=np.float64,
+            # force per speed at which the anchors of the spring move apart
+            damping=np.float64,
+            # +inf/-inf when the spring has no limit
+            max_force=np.float64,
+            min_force=np.float64,
+            selected=np.bool_,
+        )
+
+    # Appends anchors in bulk and returns the index of the first
+    def add_anchors(self, pos, vel, mass, static) -> int:
+        self.held = None
+        mass = np.asarray(mass, dtype=np.float64)
+        static = np.asarray(static, dtype=np.bool_)
+        return self.anchors.extend(
+            len(mass),
+            pos=pos,
+            vel=vel,
+            mass=mass,
+            coef=np.where(static, 0, 1 / mass),
+            radius=np.sqrt(mass) * SIZE_RATIO,
+            static=static,
+        )
+
+    # Keeps what the kernels look up every step, e.g. which springs follow which
+    # law or which anchors are locked, for all steps run within. Only for runs of
+    # steps nothing else edits the engine during. Adding or removing rows and
+    # edits through the entities drop what was kept.
+    @contextmanager
+    def hold(self):
+        holding = self.holding
+        self.holding = True
+        try:
+            yield
+        finally:
+            self.holding = holding
+            if not holding:
+                self.held = None
+
+    # The per step lookups of the kernels, kept while holding
+    def lookups(self) -> dict:
+        held = self.held
+        if held is not None:
+            return held
+        n, m = self.anchors.size, self.springs.size
+        law = self.springs.law[:m]
+        stiffness = self.springs.stiffness[:m]
+        # springs per law, shifted by one for the custom ones
+        counts = np.bincount(law + 1, minlength=len(LAWS) + 1)
+        groups = []
+        for law_id in np.flatnonzero(counts[1:]).tolist():
+            group = np.flatnonzero(law == law_id)
+            groups.append((law_id, group, stiffness[group]))
+        locked = self.anchors.locked[:n]
+        held = {
+            # (law id, spring rows, their stiffness) of every law present
+            "groups": groups,
+            "custom": np.flatnonzero(law == LAW_CUSTOM) if counts[0] else None,
+            "damped": bool(self.springs.damping[:m].any()),
+            # anchors which move, None for all of them
+            "free": ~locked if locked.any() else None,
+            # (gravity, force of it on every anchor)
+            "gravity": None,
+        }
+        if self.holding:
+            self.held = held
+        return held
+
+    # Appends springs in bulk and returns the index of the first, start and end being anchor indices
+    def add_springs(self, start, end, law, stiffness, max_force, min_force, rest_length=0, damping=0) -> int:
+        self.held = None
+        return self.springs.extend(
+            len(start),
+            start=start,
+            end=end,
+            law=law,
+            stiffness=stiffness,
+            rest_length=rest_length,
+            damping=damping,
+            max_force=max_force,
+            min_force=min_force,
+        )
+
+    # Index of the springs attached to every anchor, the rows of the springs attached to
+    # anchor i being springs[offsets[i]:offsets[i + 1]]. It is kept until springs get
+    # added, removed or rewired.
+    def adjacency(self) -> Tuple[np.ndarray, np.ndarray]:
+        key = (self.anchors.version, self.springs.version)
+        if self.adjacent is None or self.adjacent[0] != key:
+            n, m = self.anchors.size, self.springs.size
+            ends = np.concatenate([self.springs.start[:m], self.springs.end[:m]])
+            offsets = np.zeros(n + 1, dtype=np.intp)
+            np.cumsum(np.bincount(ends, minlength=n), out=offsets[1:])
+            springs = np.argsort(ends, kind="stable") % max(m, 1)
+            self.adjacent = key, offsets, springs
+        return self.adjacent[1], self.adjacent[2]
+
+    # Rows of the springs attached to any of the anchors at the given rows
+    def attached(self, rows) -> np.ndarray:
+        offsets, springs = self.adjacency()
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.intp))
+        first = offsets[rows]
+        counts = offsets[rows + 1] - first
+        # the ranges of all rows one after another
+        at = np.arange(counts.sum()) + np.repeat(first - np.cumsum(counts) + counts, counts)
+        return np.unique(springs[at])
+
+    # Removes the anchors at the given rows along with the springs attached to them,
+    # whose rows can be given if they were looked up already, see attached
+    def remove_anchors(self, rows, springs: Optional[np.ndarray] = None):
+        self.held = None
+        self.springs.remove_rows(self.attached(rows) if springs is None else springs)
+        moved = self.anchors.remove_rows(rows)
+        m = self.springs.size
+        self.springs.start[:m] = moved[self.springs.start[:m]]
+        self.springs.end[:m] = moved[self.springs.end[:m]]
+        self.springs.version += 1
+
+    def remove_springs(self, rows):
+        self.held = None
+        self.springs.remove_rows(rows)
+
+    # indices of the anchors which left the simulated area, among the given rows if any
+    def out_of_bounds(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if rows is not None:
+            pos = self.anchors.pos[rows]
+            return rows[np.einsum("ij,ij->i", pos, pos) > BOUNDS]
+        pos = self.anchors.pos[:self.anchors.size]
+        return np.flatnonzero(np.einsum("ij,ij->i", pos, pos) > BOUNDS)
+
+    # magnitude of the elastic force of every spring given the distance between its anchors.
+    # Most laws get how far each spring is stretched beyond its rest length, see STRETCHED.
+    # The last axis of dist are the springs, leading axes e.g. several frames get evaluated
+    # at once. Magnitudes which aren't finite, e.g. of hyperbolic springs whose anchors
+    # coincide, are 0 unless a force limit bounds them.
+    def magnitudes(self, dist: np.ndarray) -> np.ndarray:
+        m = self.springs.size
+        lookups = self.lookups()
+        stretch = dist - self.springs.rest_length[:m]
+        magnitude = np.zeros(stretch.shape)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # one call per law present, e.g. all hooke springs at once
+            for law_id, group, stiffness in lookups["groups"]:
+                measure = stretch if STRETCHED[law_id] else dist
+                magnitude[..., group] = KERNELS[law_id](measure[..., group], stiffness)
+
+        custom = lookups["custom"]
+        if custom is not None:
+            for index in np.argwhere(dist[..., custom] > 0).tolist():
+                index[-1] = int(custom[index[-1]])
+                index = tuple(index)
+                spring = self.springs.view(index[-1])
+                magnitude[index] = spring.magnitude(float(stretch[index] if spring.stretched else dist[index]))
+
+        np.clip(magnitude, self.springs.min_force[:m], self.springs.max_force[:m], out=magnitude)
+        magnitude[~np.isfinite(magnitude)] = 0
+        return magnitude
+
+    # total force the springs apply on each anchor for the given anchor positions,
+    # and velocities if the springs are to be damped
+    def spring_forces(self, pos: np.ndarray, vel: Optional[np.ndarray] = None) -> np.ndarray:
+        n, m = self.anchors.size, self.springs.size
+        force = np.zeros((n, 2))
+        if m == 0:
+            return force
+
+        start = self.springs.start[:m]
+        end = self.springs.end[:m]
+        delta = np.take(pos, end, axis=0) - np.take(pos, start, axis=0)
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+        magnitude = self.magnitudes(dist)
+        damping = self.springs.damping[:m]
+        if vel is not None and self.lookups()["damped"]:
+            # speed at which the anchors move apart, times the distance
+            relative = np.take(vel, end, axis=0) - np.take(vel, start, axis=0)
+            rate = relative[:, 0] * delta[:, 0] + relative[:, 1] * delta[:, 1]
+            magnitude += damping * np.divide(rate, dist, out=np.zeros(m), where=dist > 0)
+        scale = np.divide(magnitude, dist, out=np.zeros(m), where=dist > 0)
+        pull = delta * scale[:, None]
+
+        # the start anchor gets pulled towards the end and vice versa
+        for axis in range(2):
+            force[:, axis] = np.bincount(start, pull[:, axis], n) - np.bincount(end, pull[:, axis], n)
+        return force
+
+    # Derivative of the pull of every spring on its start anchor with respect to the
+    # position of its end anchor, as the 2x2 blocks along * u u^T + across * I with u
+    # the direction from start to end. The derivative of the law is taken numerically
+    # so custom laws and force limits are covered. Both parts are kept non-negative,
+    # e.g. for the falling force of hyperbolic springs, which keeps the system of an
+    # implicit step positive definite.
+    def stiffness(self, pos: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        m = self.springs.size
+        start = self.springs.start[:m]
+        end = self.springs.end[:m]
+        delta = np.take(pos, end, axis=0) - np.take(pos, start, axis=0)
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+        step = 1e-6 * np.maximum(dist, 1e-3)
+        magnitude = self.magnitudes(dist)
+        slope = (self.magnitudes(dist + step) - magnitude) / step
+        direction = np.divide(delta, dist[:, None], out=np.zeros((m, 2)), where=dist[:, None] > 0)
+        across = np.maximum(np.divide(magnitude, dist, out=np.zeros(m), where=dist > 0), 0)
+        along = np.maximum(slope, 0) - across
+        return direction, along, across
+
+    # Change of the spring forces on every anchor when the anchors move by dx,
+    # given the blocks of stiffness()
+    def stiffness_product(self, blocks, dx: np.ndarray) -> np.ndarray:
+        direction, along, across = blocks
+        n, m = self.anchors.size, self.springs.size
+        start = self.springs.start[:m]
+        end = self.springs.end[:m]
+        stretch = np.take(dx, end, axis=0) - np.take(dx, start, axis=0)
+        pull = across[:, None] * stretch
+        pull += direction * (along * np.einsum("ij,ij->i", direction, stretch))[:, None]
+        result = np.zeros((n, 2))
+        for axis in range(2):
+            result[:, axis] = np.bincount(start, pull[:, axis], n) - np.bincount(end, pull[:, axis], n)
+        return result
+
+    # Diagonal of the stiffness matrix summed up per anchor and axis, negated so it is non-negative
+    def stiffness_diagonal(self, blocks) -> np.ndarray:
+        direction, along, across = blocks
+        n, m = self.anchors.size, self.springs.size
+        diagonal = np.zeros((n, 2))
+        for axis in range(2):
+            block = along * direction[:, axis] ** 2 + across
+            diagonal[:, axis] = np.bincount(self.springs.start[:m], block, n) + np.bincount(self.springs.end[:m], block, n)
+        return diagonal
+
+    # total force on each anchor, gravity being None if disabled and vel None to not damp
+    def forces(self, pos: np.ndarray, gravity=None, vel: Optional[np.ndarray] = None) -> np.ndarray:
+        self.evaluations += 1
+        with self.profiler.measure("forces"):
+            force = self.spring_forces(pos, vel)
+        if gravity is not None:
+            with self.profiler.measure("gravity"):
+                lookups = self.lookups()
+                key = (float(gravity[0]), float(gravity[1]))
+                if lookups["gravity"] is None or lookups["gravity"][0] != key:
+                    lookups["gravity"] = key, self.anchors.mass[:self.anchors.size, None] * np.asarray(key)
+                force += lookups["gravity"][1]
+        return force
+
+    # acceleration of each anchor in the given state, zero for static or locked anchors
+    def acceleration(self, pos: np.ndarray, vel: np.ndarray, gravity=None) -> np.ndarray:
+        return self.anchors.coef[:self.anchors.size, None] * self.forces(pos, gravity, vel)
+
+    # Pushes overlapping anchors apart and bounces them off each other and returns the
+    # pairs which touched, see collisions.collide. coef overrides which anchors can move.
+    def collide(self, restitution: float, coef: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        n = self.anchors.size
+        return collisions.collide(
+            self.anchors.pos[:n],
+            self.anchors.vel[:n],
+            self.anchors.radius[:n],
+            self.anchors.coef[:n] if coef is None else coef,
+            restitution,
+        )
+
+    # A new engine holding copies of the given anchor and spring rows, the springs
+    # reaching only anchors among them, e.g. to step a part of the scene on its own.
+    # Anchor rows have to be sorted.
+    def subset(self, anchors: np.ndarray, springs: np.ndarray) -> 'Engine':
+        sub = Engine()
+        # timings of the subset count towards this engine
+        sub.profiler = self.profiler
+        for table, source, rows in [(sub.anchors, self.anchors, anchors), (sub.springs, self.springs, springs)]:
+            table.extend(len(rows), **{name: getattr(source, name)[rows] for name in source.columns})
+            table.uid[:len(rows)] = source.uid[rows]
+        sub.springs.start[:len(springs)] = np.searchsorted(anchors, self.springs.start[springs])
+        sub.springs.end[:len(springs)] = np.searchsorted(anchors, self.springs.end[springs])
+        # springs evaluated one by one use their own view
+        sub.springs.factory = lambda index: self.springs.view(int(springs[index]))
+        return sub
+
+    # Copies the state of the anchors of a subset back to the given rows
+    def write_back(self, sub: 'Engine', anchors: np.ndarray):
+        self.anchors.pos[anchors] = sub.anchors.pos[:len(anchors)]
+        self.anchors.vel[anchors] = sub.anchors.vel[:len(anchors)]
+        self.evaluations += sub.evaluations
+
+    # Tells the listener that a field of the given row was set, e.g. by the user
+    def edited(self, table: Table, index: int, column: str):
+        self.held = None
+        if column in ("start", "end"):
+            # the springs got rewired
+            table.version += 1
+        if self.on_edit is not None:
+            self.on_edit(table, index, column)
+
+    # Advances all anchors by one semi-implicit euler step
+    def step(self, dt: float, gravity=None):
+        n = self.anchors.size
+        pos = self.anchors.pos[:n]
+        vel = self.anchors.vel[:n]
+        vel += dt * self.acceleration(pos, vel, gravity)
+        free = self.lookups()["free"]
+        if free is None:
+            pos += dt * vel
+        else:
+            pos[free] += dt * vel[free]
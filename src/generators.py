@@ -0,0 +1,118 @@
+from typing import Callable, Dict, Optional, Sequence, Tuple
+from sim import Simulation, HookesSpring
+import numpy as np
+
+# distance between neighbouring anchors of the generated structures
+SPACING = 0.3
+
+# Every generator adds its anchors and springs in bulk straight into the engine of the
+# simulation and returns their rows. spring is a spring class or a list of classes
+# taking turns, the remaining keyword arguments go to Simulation.add_springs, e.g.
+# stiffness or damping. The springs rest at the length they are built with unless a
+# rest length is given, except for ones which aren't stretched, like the hyperbolic
+# ones, which have none. pinned are the indices among the new anchors which are static.
+
+# Adds anchors at the given positions and springs between the given pairs of them
+def build(sim: Simulation, pos: np.ndarray, start: np.ndarray, end: np.ndarray, spring=HookesSpring,
+          mass=1, pinned: Sequence[int] = (), **params) -> Tuple[np.ndarray, np.ndarray]:
+    static = np.zeros(len(pos), dtype=np.bool_)
+    static[list(pinned)] = True
+    with sim.lock:
+        anchors = sim.add_anchors(pos, mass=mass, static=static)
+        springs = sim.add_springs(spring, anchors[start], anchors[end], **params)
+    return anchors, springs
+
+# Positions of a grid of rows x cols cells around center, row by row from the top.
+# Every other row of a triangular grid is shifted by half a cell and the rows are
+# closer, so all neighbours are equally far apart.
+def grid(rows: int, cols: int, center=(0, 0), spacing: float = SPACING, triangular: bool = False) -> np.ndarray:
+    row, col = np.divmod(np.arange(rows * cols), cols)
+    x = col.astype(np.float64)
+    y = -row.astype(np.float64)
+    if triangular:
+        x += (row % 2) / 2
+        y *= np.sqrt(3) / 2
+    pos = np.stack([x, y], axis=1) * spacing
+    pos -= (pos.min(axis=0) + pos.max(axis=0)) / 2 if len(pos) else 0
+    return pos + np.asarray(center, dtype=np.float64)
+
+# Pairs of cells (start, end) of a grid of rows x cols cells where end is
+# the given number of rows below and columns right of start
+def neighbours(rows: int, cols: int, down: int, right: int) -> Tuple[np.ndarray, np.ndarray]:
+    ids = np.arange(rows * cols).reshape(rows, cols)
+    top, bottom = max(0, -down), rows - max(0, down)
+    left, far = max(0, -right), cols - max(0, right)
+    start = ids[top:bottom, left:far]
+    end = ids[top + down:bottom + down, left + right:far + right]
+    return start.ravel(), end.ravel()
+
+# Joins the pairs of neighbours of all the given offsets
+def connect(rows: int, cols: int, offsets) -> Tuple[np.ndarray, np.ndarray]:
+    pairs = [neighbours(rows, cols, down, right) for down, right in offsets]
+    return np.concatenate([start for start, _ in pairs]), np.concatenate([end for _, end in pairs])
+
+# A chain of the given number of links along the x axis from start, hanging from its
+# first anchor. With a row length it winds back and forth in rows of that many anchors,
+# so long chains stay compact.
+def chain(sim: Simulation, links: int, start=(0, 0), spacing: float = SPACING, row_length: Optional[int] = None,
+          pinned: Sequence[int] = (0,), **params) -> Tuple[np.ndarray, np.ndarray]:
+    n = links + 1
+    cols = n if row_length is None else row_length
+    row, col = np.divmod(np.arange(n), cols)
+    col = np.where(row % 2 == 1, cols - 1 - col, col)
+    pos = np.stack([col, -row], axis=1) * spacing + np.asarray(start, dtype=np.float64)
+    return build(sim, pos, np.arange(links), np.arange(1, n), pinned=pinned, **params)
+
+# A grid of rows x cols anchors around center, each connected to its right and lower
+# neighbours, or to the six around it if triangular. It hangs from its top corners.
+def lattice(sim: Simulation, rows: int, cols: int, center=(0, 0), spacing: float = SPACING,
+            triangular: bool = False, pinned: Optional[Sequence[int]] = None, **params) -> Tuple[np.ndarray, np.ndarray]:
+    pos = grid(rows, cols, center, spacing, triangular)
+    if not triangular:
+        start, end = connect(rows, cols, [(0, 1), (1, 0)])
+    else:
+        start, end = connect(rows, cols, [(0, 1), (1, 0), (1, -1), (1, 1)])
+        # the shifted rows reach right below them, the others left
+        shifted = (start // cols) % 2 == 1
+        right = end - start == cols + 1
+        left = end - start == cols - 1
+        keep = ~(right & ~shifted) & ~(left & shifted)
+        start, end = start[keep], end[keep]
+    if pinned is None:
+        pinned = (0, cols - 1)
+    return build(sim, pos, start, end, pinned=pinned, **params)
+
+# A cloth of rows x cols anchors around center, hanging from its top corners. Next to the
+# springs between neighbours it has shear springs across every cell, which keep the
+# cells from folding flat, and with bend springs between every other anchor it also
+# resists folding along the rows and columns.
+def cloth(sim: Simulation, rows: int, cols: int, center=(0, 0), spacing: float = SPACING, shear: bool = True,
+          bend: bool = False, pinned: Optional[Sequence[int]] = None, **params) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = [(0, 1), (1, 0)]
+    if shear:
+        offsets += [(1, 1), (1, -1)]
+    if bend:
+        offsets += [(0, 2), (2, 0)]
+    start, end = connect(rows, cols, offsets)
+    if pinned is None:
+        pinned = (0, cols - 1)
+    return build(sim, grid(rows, cols, center, spacing), start, end, pinned=pinned, **params)
+
+# n anchors scattered over a square of the given size around center, with springs
+# between random pairs of distinct anchors, two per anchor by default
+def random_graph(sim: Simulation, n: int, springs: Optional[int] = None, center=(0, 0), size: Optional[float] = None,
+                 seed=None, pinned: Sequence[int] = (0,), **params) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    m = 2 * n if springs is None else springs
+    size = SPACING * np.sqrt(n) if size is None else size
+    pos = (rng.random((n, 2)) - 0.5) * size + np.asarray(center, dtype=np.float64)
+    start = rng.integers(0, n, m)
+    end = (start + rng.integers(1, max(n, 2), m)) % n
+    return build(sim, pos, start, end, pinned=pinned, **params)
+
+GENERATORS: Dict[str, Callable[..., Tuple[np.ndarray, np.ndarray]]] = {
+    "chain": chain,
+    "lattice": lattice,
+    "cloth": cloth,
+    "random": random_graph,
+}
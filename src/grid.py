@@ -1,15 +1,22 @@
+from typing import Optional, Tuple
 import math
+import numpy as np
+import pygame
 from render import Render
 
+COLORS = [
+    (10, 10, 10),
+    (30, 30, 30),
+    (50, 50, 50),
+    (100, 100, 100),
+]
+
+# distance between two grid lines in world units at the given zoom
+def grid_size(zoom: float) -> float:
+    return 0.004 / (10 ** math.floor(math.log10(zoom)))
+
 def render_grid(render: Render):
-    # TODO: make this dynamic
-    GRID_SIZE = 0.004 / (10 ** math.floor(math.log10(render.camera.zoom)))
-    COLORS = [
-        (10, 10, 10),
-        (30, 30, 30),
-        (50, 50, 50),
-        (100, 100, 100),
-    ]
+    GRID_SIZE = grid_size(render.camera.zoom)
     pad_x, pad_y = render.get_padding()
     grid_off_x = math.floor(render.camera.pos.x / GRID_SIZE)
     grid_off_y = math.floor(render.camera.pos.y / GRID_SIZE)
@@ -36,7 +43,7 @@ def render_grid(render: Render):
     for y in grid_y:
         if y % 100 == 0:
             render.draw_hline(COLORS[2], y * GRID_SIZE)
-    
+
     for x in grid_x:
         if x % 1000 == 0:
             render.draw_vline(COLORS[3], x * GRID_SIZE)
@@ -44,3 +51,75 @@ def render_grid(render: Render):
         if y % 1000 == 0:
             render.draw_hline(COLORS[3], y * GRID_SIZE)
 
+# background, then the grid colors by level
+PALETTE = np.array([(0, 0, 0)] + COLORS, dtype=np.uint8)
+
+# Level of the brightest grid line on each pixel of a screen axis, -1 where there is none.
+# Line k lies at center + direction * (k * spacing - origin).
+def line_levels(length: int, center: float, direction: int, spacing: float, origin: int) -> np.ndarray:
+    bounds = sorted([(0 - center) * direction + origin, (length - 1 - center) * direction + origin])
+    k = np.arange(math.ceil(bounds[0] / spacing), math.floor(bounds[1] / spacing) + 1)
+    pixels = np.rint(center + direction * (k * spacing - origin)).astype(np.intp)
+    inside = (pixels >= 0) & (pixels < length)
+    levels = (k % 10 == 0).astype(np.int8) + (k % 100 == 0) + (k % 1000 == 0)
+    result = np.full(length, -1, dtype=np.int8)
+    np.maximum.at(result, pixels[inside], levels[inside])
+    return result
+
+# The grid drawn once into a surface. Panning scrolls the surface and only
+# fills in the strips which came into view, a full redraw only happens on zoom or resize.
+class Grid:
+    surface: Optional[pygame.Surface]
+    # (zoom, pixels, width, height) the surface was drawn for
+    key: Optional[tuple]
+    # camera position in pixels the surface was drawn for
+    origin: Tuple[int, int]
+
+    def __init__(self):
+        self.surface = None
+        self.key = None
+        self.origin = (0, 0)
+
+    def draw(self, render: Render):
+        zoom = render.camera.zoom
+        scale = render.pixels * zoom
+        key = (zoom, render.pixels, render.width, render.height)
+        origin = (round(render.camera.pos.x * scale), round(render.camera.pos.y * scale))
+        width, height = int(render.width), int(render.height)
+
+        spacing = grid_size(zoom) * scale
+        columns = line_levels(width, render.offset.x, 1, spacing, origin[0])
+        rows = line_levels(height, render.offset.y, -1, spacing, origin[1])
+
+        dx = origin[0] - self.origin[0]
+        dy = origin[1] - self.origin[1]
+        if key != self.key or abs(dx) >= width or abs(dy) >= height:
+            self.surface = pygame.Surface((width, height), depth=32)
+            self.fill(columns, rows, pygame.Rect(0, 0, width, height))
+        elif dx != 0 or dy != 0:
+            # moving the camera right moves the grid left, moving it up moves the grid down
+            self.surface.scroll(-dx, dy)
+            if dx > 0:
+                self.fill(columns, rows, pygame.Rect(width - dx, 0, dx, height))
+            elif dx < 0:
+                self.fill(columns, rows, pygame.Rect(0, 0, -dx, height))
+            if dy > 0:
+                self.fill(columns, rows, pygame.Rect(0, 0, width, dy))
+            elif dy < 0:
+                self.fill(columns, rows, pygame.Rect(0, height + dy, width, -dy))
+        self.key = key
+        self.origin = origin
+
+        render.screen.blit(self.surface, (0, 0))
+
+    # Redraws the given region of the surface, keeping the brighter color where lines cross
+    def fill(self, columns: np.ndarray, rows: np.ndarray, rect: pygame.Rect):
+        # the colors are grays, so their mapped values are ordered like their brightness
+        palette = np.array([self.surface.map_rgb(color) for color in PALETTE.tolist()], dtype=np.uint32)
+        pixels = pygame.surfarray.pixels2d(self.surface)
+        np.maximum(
+            palette[columns[rect.left:rect.right] + 1][:, None],
+            palette[rows[rect.top:rect.bottom] + 1][None, :],
+            out=pixels[rect.left:rect.right, rect.top:rect.bottom],
+        )
+        del pixels
@@ -0,0 +1,228 @@
+from typing import Dict, List, Optional, Tuple, Type
+from abc import ABC, abstractmethod
+from engine import Engine
+import numpy as np
+
+# Advances the anchors of an engine by a timestep
+class Integrator(ABC):
+    name: str
+
+    @abstractmethod
+    def step(self, engine: Engine, dt: float, gravity=None):
+        pass
+
+    # Drops state carried over between steps, e.g. after the scene changed
+    def reset(self):
+        pass
+
+# Semi-implicit euler, one force evaluation per step
+class Euler(Integrator):
+    name = "euler"
+
+    def step(self, engine: Engine, dt: float, gravity=None):
+        engine.step(dt, gravity)
+
+# Velocity verlet, symplectic and second order, one force evaluation per step
+# as the acceleration at the end of a step is reused at the start of the next
+class Verlet(Integrator):
+    name = "verlet"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.acc = None
+
+    def step(self, engine: Engine, dt: float, gravity=None):
+        n = engine.anchors.size
+        pos = engine.anchors.pos[:n]
+        vel = engine.anchors.vel[:n]
+        free = ~engine.anchors.locked[:n]
+
+        acc = self.acc
+        if acc is None:
+            acc = engine.acceleration(pos, vel, gravity)
+        pos[free] += dt * vel[free] + 0.5 * dt * dt * acc[free]
+        new_acc = engine.acceleration(pos, vel, gravity)
+        vel += 0.5 * dt * (acc + new_acc)
+        self.acc = new_acc
+
+# Explicit runge-kutta method given by its butcher tableau,
+# with an optional second set of weights for error estimation
+class RungeKutta(Integrator):
+    a: List[List[float]]
+    b: List[float]
+    # weights of the embedded lower order solution
+    b_err: Optional[List[float]] = None
+
+    # Derivative of the state (pos, vel)
+    def derivative(self, engine: Engine, pos, vel, gravity, free) -> Tuple[np.ndarray, np.ndarray]:
+        return vel * free[:, None], engine.acceleration(pos, vel, gravity)
+
+    # Returns the state after a step of length h together with the error estimate
+    def solve(self, engine: Engine, pos, vel, h: float, gravity, free):
+        kx, kv = [], []
+        for i in range(len(self.b)):
+            x, v = pos, vel
+            for j in range(i):
+                if self.a[i][j] != 0:
+                    x = x + h * self.a[i][j] * kx[j]
+                    v = v + h * self.a[i][j] * kv[j]
+            dx, dv = self.derivative(engine, x, v, gravity, free)
+            kx.append(dx)
+            kv.append(dv)
+
+        new_pos = pos + h * sum(b * k for b, k in zip(self.b, kx) if b != 0)
+        new_vel = vel + h * sum(b * k for b, k in zip(self.b, kv) if b != 0)
+        if self.b_err is None:
+            return new_pos, new_vel, None
+        err_pos = h * sum((b - e) * k for b, e, k in zip(self.b, self.b_err, kx))
+        err_vel = h * sum((b - e) * k for b, e, k in zip(self.b, self.b_err, kv))
+        return new_pos, new_vel, (err_pos, err_vel)
+
+    def step(self, engine: Engine, dt: float, gravity=None):
+        n = engine.anchors.size
+        free = ~engine.anchors.locked[:n]
+        pos, vel, _ = self.solve(engine, engine.anchors.pos[:n], engine.anchors.vel[:n], dt, gravity, free)
+        engine.anchors.pos[:n] = pos
+        engine.anchors.vel[:n] = vel
+
+# Classic fourth order runge-kutta, four force evaluations per step
+class RK4(RungeKutta):
+    name = "rk4"
+    a = [[], [0.5], [0, 0.5], [0, 0, 1]]
+    b = [1 / 6, 1 / 3, 1 / 3, 1 / 6]
+
+# Dormand-prince 5(4) with step size control. Every step is split into
+# substeps whose length follows the estimated local error, so calm scenes
+# take a few large substeps and stiff moments many small ones.
+class Adaptive(RungeKutta):
+    name = "adaptive"
+    a = [
+        [],
+        [1 / 5],
+        [3 / 40, 9 / 40],
+        [44 / 45, -56 / 15, 32 / 9],
+        [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+        [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+        [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+    ]
+    b = [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0]
+    b_err = [5179 / 57600, 0, 7571 / 16695, 393 / 640, -92097 / 339200, 187 / 2100, 1 / 40]
+
+    def __init__(self, rtol: float = 1e-4, atol: float = 1e-6, max_substeps: int = 1000):
+        self.rtol = rtol
+        self.atol = atol
+        self.max_substeps = max_substeps
+        self.reset()
+
+    def reset(self):
+        # substep length carried over between steps
+        self.h = None
+
+    def error(self, pos, vel, new_pos, new_vel, err) -> float:
+        scale_pos = self.atol + self.rtol * np.maximum(np.abs(pos), np.abs(new_pos))
+        scale_vel = self.atol + self.rtol * np.maximum(np.abs(vel), np.abs(new_vel))
+        ratio = np.concatenate([(err[0] / scale_pos).ravel(), (err[1] / scale_vel).ravel()])
+        return float(np.sqrt(np.mean(ratio * ratio))) if len(ratio) else 0.0
+
+    def step(self, engine: Engine, dt: float, gravity=None):
+        n = engine.anchors.size
+        free = ~engine.anchors.locked[:n]
+        pos = engine.anchors.pos[:n].copy()
+        vel = engine.anchors.vel[:n].copy()
+        h = self.h or dt
+        h_min = dt / self.max_substeps
+
+        remaining = dt
+        while remaining > 0:
+            substep = min(h, remaining)
+            new_pos, new_vel, err = self.solve(engine, pos, vel, substep, gravity, free)
+            error = self.error(pos, vel, new_pos, new_vel, err)
+            accepted = error <= 1 or substep <= h_min
+            if accepted:
+                remaining -= substep
+                pos, vel = new_pos, new_vel
+
+            factor = 5 if error == 0 else min(5, max(0.2, 0.9 * error ** -0.2))
+            if accepted and substep < h:
+                # the substep got cut short by the end of the step, don't let that shrink h
+                h = max(h, substep * factor)
+            else:
+                h = max(h_min, substep * factor)
+        self.h = h
+
+        engine.anchors.pos[:n] = pos
+        engine.anchors.vel[:n] = vel
+
+# Backward euler, solving for the velocities at the end of the step with the spring
+# forces linearized around the start of the step:
+#   (M - dt D - dt^2 K) dv = dt (f + dt K v)
+# K and D being the sparse stiffness and damping matrices of the springs, which are
+# never assembled but applied spring by spring inside a preconditioned conjugate
+# gradient solve. Stiff springs stay stable at timesteps explicit methods blow up
+# at, at the price of some numerical damping and a few force-sized passes per step.
+class Implicit(Integrator):
+    name = "implicit"
+
+    def __init__(self, tolerance: float = 1e-6, max_iterations: int = 100):
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.reset()
+
+    def reset(self):
+        # change of velocity of the last step, the first guess for the next
+        self.dv = None
+        # conjugate gradient iterations of the last step
+        self.iterations = 0
+
+    def step(self, engine: Engine, dt: float, gravity=None):
+        n = engine.anchors.size
+        pos = engine.anchors.pos[:n]
+        vel = engine.anchors.vel[:n]
+        # static and locked anchors keep their velocity
+        free = (engine.anchors.coef[:n] > 0)[:, None]
+        mass = engine.anchors.mass[:n, None]
+
+        force = engine.forces(pos, gravity, vel)
+        blocks = engine.stiffness(pos)
+        # the damping of a spring only acts along it
+        m = engine.springs.size
+        damping = (blocks[0], engine.springs.damping[:m], np.zeros(m))
+
+        def system(dv):
+            return free * (mass * dv - dt * engine.stiffness_product(damping, dv)
+                           - dt * dt * engine.stiffness_product(blocks, dv))
+
+        rhs = free * dt * (force + dt * engine.stiffness_product(blocks, vel))
+        # jacobi preconditioner, 1 for the anchors which don't move so they stay at 0
+        diagonal = mass + dt * engine.stiffness_diagonal(damping) + dt * dt * engine.stiffness_diagonal(blocks)
+        inverse = np.where(free, 1 / diagonal, 1)
+
+        dv = self.dv if self.dv is not None and len(self.dv) == n else np.zeros((n, 2))
+        dv = dv * free
+        residual = rhs - system(dv)
+        z = inverse * residual
+        direction = z
+        rz = np.vdot(residual, z)
+        limit = (self.tolerance * np.linalg.norm(rhs)) ** 2
+        iterations = 0
+        while iterations < self.max_iterations and np.vdot(residual, residual) > limit:
+            product = system(direction)
+            alpha = rz / np.vdot(direction, product)
+            dv = dv + alpha * direction
+            residual = residual - alpha * product
+            z = inverse * residual
+            rz, previous = np.vdot(residual, z), rz
+            direction = z + (rz / previous) * direction
+            iterations += 1
+        self.iterations = iterations
+        self.dv = dv
+
+        vel += dv
+        moving = ~engine.anchors.locked[:n]
+        pos[moving] += dt * vel[moving]
+
+INTEGRATORS: Dict[str, Type[Integrator]] = {
+    cls.name: cls for cls in [Euler, Verlet, RK4, Adaptive, Implicit]
+}
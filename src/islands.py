@@ -0,0 +1,204 @@
+from typing import List
+import numpy as np
+
+# anchors slower than this (m/s) and accelerating less than this (m/s^2) count as resting
+SLEEP_SPEED = 0.01
+SLEEP_ACCELERATION = 0.1
+# steps all anchors of an island have to rest in a row before it falls asleep
+SLEEP_STEPS = 100
+
+# Connected components of a graph with n nodes and the given edges, as the
+# smallest node of its component for every node. Roots get hooked onto the
+# smallest neighbouring root and paths halved until nothing changes, which
+# takes a few rounds even for long chains.
+def components(n: int, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    parent = np.arange(n)
+    while True:
+        first, second = parent[start], parent[end]
+        differ = first != second
+        if not differ.any():
+            return parent
+        np.minimum.at(parent, np.maximum(first[differ], second[differ]), np.minimum(first[differ], second[differ]))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+# Splits the anchors of an engine into islands connected by springs, static
+# anchors holding them in place but not joining them, and puts islands which
+# came to rest to sleep. Only the awake islands get stepped, so a scene which
+# settled costs next to nothing. Islands wake when one of their anchors or
+# springs gets edited or an awake anchor bumps into them.
+class Islands:
+    # island of every anchor row, -1 for static anchors
+    island: np.ndarray
+    # island of every spring row, -1 for springs between static anchors
+    spring_island: np.ndarray
+    # whether each island is asleep
+    asleep: np.ndarray
+    # steps every anchor row has been resting in a row
+    calm: np.ndarray
+    # number of sleeping anchors
+    sleeping: int
+
+    def __init__(self):
+        self.key = None
+        self.island = np.zeros(0, dtype=np.intp)
+        self.spring_island = np.zeros(0, dtype=np.intp)
+        self.asleep = np.zeros(0, dtype=np.bool_)
+        self.calm = np.zeros(0, dtype=np.int64)
+        self.sleeping = 0
+        self.sleeping_uids = np.zeros(0, dtype=np.int64)
+        # (anchor rows, spring rows, reached anchor rows) which get stepped, see awake_rows,
+        # None if they have to be worked out again
+        self.awake = None
+        # the islands changed in a way which can't be told from the size of the tables
+        self.dirty = False
+        # uids of anchors to wake on the next step, True to wake everything.
+        # Edits come from other threads, so they only get noted down here.
+        self.pending: List[int] = []
+        self.pending_all = False
+        # changes whenever the set of stepped anchors does
+        self.version = 0
+        # version the integrator last stepped
+        self.stepped = None
+
+    # Works the islands out again if anchors or springs were added, removed or
+    # rewired. Islands which were asleep as a whole stay asleep.
+    def refresh(self, engine):
+        anchors, springs = engine.anchors, engine.springs
+        key = (anchors.size, anchors.next_uid, springs.size, springs.next_uid)
+        if key == self.key and not self.dirty:
+            return
+        n, m = anchors.size, springs.size
+        # rows might have moved, uids don't
+        was_asleep = np.isin(anchors.uid[:n], self.sleeping_uids)
+
+        static = anchors.static[:n]
+        start, end = springs.start[:m], springs.end[:m]
+        linked = ~(static[start] | static[end])
+        island = np.unique(components(n, start[linked], end[linked]), return_inverse=True)[1].astype(np.intp)
+        island[static] = -1
+        count = int(island.max()) + 1 if n else 0
+        awake = np.bincount(island[~static], ~was_asleep[~static], count) > 0
+
+        self.island = island
+        self.spring_island = np.maximum(island[start], island[end])
+        self.asleep = ~awake
+        self.calm = np.where(was_asleep, SLEEP_STEPS, 0)
+        self.key = key
+        self.dirty = False
+        self.changed(engine)
+
+    # Updates what is cached about the sleeping islands after some fell asleep or woke up
+    def changed(self, engine):
+        self.awake = None
+        self.version += 1
+        sleeping = self.sleeping_mask()
+        self.sleeping = int(sleeping.sum())
+        self.sleeping_uids = engine.anchors.uid[:len(sleeping)][sleeping]
+
+    # Whether each anchor row is asleep
+    def sleeping_mask(self) -> np.ndarray:
+        if len(self.asleep) == 0:
+            return np.zeros(len(self.island), dtype=np.bool_)
+        return (self.island >= 0) & self.asleep[np.maximum(self.island, 0)]
+
+    # Rows of the anchors of the awake islands, of the springs attached to them
+    # and of all anchors these springs reach, including static ones
+    def awake_rows(self, engine):
+        if self.awake is None:
+            moving = self.island >= 0
+            stepped = self.spring_island >= 0
+            if self.sleeping:
+                moving &= ~self.asleep[np.maximum(self.island, 0)]
+                stepped &= ~self.asleep[np.maximum(self.spring_island, 0)]
+            springs = np.flatnonzero(stepped)
+            m = engine.springs.size
+            reached = np.concatenate([
+                np.flatnonzero(moving),
+                engine.springs.start[:m][springs],
+                engine.springs.end[:m][springs],
+            ])
+            self.awake = np.flatnonzero(moving), springs, np.unique(reached)
+        return self.awake
+
+    # Wakes the islands of the given anchor rows on the next step.
+    # Static anchors wake the islands they hold, as moving them moves their springs.
+    def wake(self, engine, rows):
+        if self.sleeping:
+            self.pending.extend(np.atleast_1d(engine.anchors.uid[rows]).tolist())
+
+    def wake_all(self):
+        if self.sleeping:
+            self.pending_all = True
+
+    def wake_pending(self, engine):
+        if self.pending_all:
+            self.pending_all = False
+            self.pending = []
+            self.asleep[:] = False
+            self.calm[:] = 0
+            self.changed(engine)
+            return
+        if not self.pending:
+            return
+        uids, self.pending = self.pending, []
+        n = engine.anchors.size
+        rows = np.flatnonzero(np.isin(engine.anchors.uid[:n], uids))
+        static = rows[self.island[rows] < 0]
+        if len(static):
+            attached = engine.attached(static)
+            rows = np.concatenate([rows, engine.springs.start[attached], engine.springs.end[attached]])
+        islands = self.island[rows]
+        islands = islands[islands >= 0]
+        if not self.asleep[islands].any():
+            return
+        self.asleep[islands] = False
+        self.calm[np.isin(self.island, islands)] = 0
+        self.changed(engine)
+
+    # Counts how long the stepped anchors have been resting given their velocity
+    # before the step, and puts islands to sleep all of whose anchors rested long enough
+    def settle(self, engine, rows: np.ndarray, previous: np.ndarray, dt: float):
+        vel = engine.anchors.vel[rows]
+        change = vel - previous
+        resting = (np.einsum("ij,ij->i", vel, vel) < SLEEP_SPEED ** 2) \
+            & (np.einsum("ij,ij->i", change, change) < (SLEEP_ACCELERATION * dt) ** 2) \
+            & ~engine.anchors.locked[rows]
+        calm = np.where(resting, self.calm[rows] + 1, 0)
+        self.calm[rows] = calm
+
+        ready = calm >= SLEEP_STEPS
+        if not ready.any():
+            return
+        islands = self.island[rows]
+        candidates = np.unique(islands[ready])
+        restless = np.unique(islands[~ready & np.isin(islands, candidates)])
+        tired = np.setdiff1d(candidates, restless)
+        if len(tired):
+            self.asleep[tired] = True
+            engine.anchors.vel[rows[np.isin(islands, tired)]] = 0
+            self.changed(engine)
+
+    # Advances the awake islands of the engine by a step of the integrator
+    def step(self, engine, integrator, dt: float, gravity=None):
+        self.refresh(engine)
+        self.wake_pending(engine)
+        rows, springs, reached = self.awake_rows(engine)
+        if self.version != self.stepped:
+            # integrators may carry state over between steps, which is sized for the previous anchors
+            integrator.reset()
+            self.stepped = self.version
+        if len(rows) == 0:
+            return
+        previous = engine.anchors.vel[rows]
+        if not self.sleeping:
+            integrator.step(engine, dt, gravity)
+        else:
+            sub = engine.subset(reached, springs)
+            with sub.hold():
+                integrator.step(sub, dt, gravity)
+            engine.write_back(sub, reached)
+        self.settle(engine, rows, previous, dt)
@@ -1,12 +1,37 @@
 import pygame
 import os
+import sys
 import time
+import scene
+from procsim import ProcessSimulation, MAX_ANCHORS, MAX_SPRINGS
 from sim import Simulation, Anchor, ConstantSpring, HookesSpring, QuadraticSpring, HyperbolicSpring, Spring
 from render import Render, Camera
-from grid import render_grid
+from grid import Grid
+from spatial import Picker
+from analysis import Trace
+from generators import GENERATORS
+from draw import draw_springs, draw_anchors, draw_text, draw_trace
+from profiler import Profiler
+from collections import deque
 from ui import SettingsUI, AnchorUI, SpringUI
 
-sim = Simulation()
+# scene loaded on start and saved with ctrl + s, .json or .npz
+scene_path = next((arg for arg in sys.argv[1:] if not arg.startswith("--")), "scene.json")
+
+# value of the command line option --name=value, default if it isn't given
+def option(name: str, default: int) -> int:
+    prefix = f"--{name}="
+    return next((int(arg[len(prefix):]) for arg in sys.argv[1:] if arg.startswith(prefix)), default)
+
+if "--process" in sys.argv:
+    # run the physics in its own process, with room for twice the scene loaded on start
+    anchors, springs = scene.read_sizes(scene_path) if os.path.exists(scene_path) else (0, 0)
+    sim = ProcessSimulation(
+        max_anchors=option("max-anchors", max(MAX_ANCHORS, 2 * anchors)),
+        max_springs=option("max-springs", max(MAX_SPRINGS, 2 * springs)),
+    )
+else:
+    sim = Simulation()
 sim.start()
 
 running = True
@@ -16,17 +41,35 @@ clock = pygame.time.Clock()
 
 camera = Camera()
 render = Render(screen, camera)
+if os.path.exists(scene_path):
+    if isinstance(sim, ProcessSimulation):
+        sim.load(scene_path, camera)
+    else:
+        scene.load(sim, scene_path, camera)
+grid = Grid()
+picker = Picker()
 settings_ui = SettingsUI(screen, sim)
 entity_ui = None
 ui_show = False
 
-records = []
+# timings of the stages of a frame, shown with the simulation's in the F3 overlay
+frame_profiler = Profiler()
+hud_show = False
+hud_font = pygame.font.Font(None, 20)
+# (time, step) of the last frames, the steps per second are measured over them
+# so they are known in process mode too
+step_history = deque(maxlen=60)
+
+# last positions of the first selected anchor
+trail = None
 previous_selection = []
 
 drag_mouse_start = None
 drag_camera_start = None
 drag_start = 0
 drag_anchor = None
+# screen pos where the rubber band selection started
+box_start = None
 
 # (icon_name, string_constructor)
 springs = [
@@ -36,6 +79,14 @@ springs = [
     ("hyperbolic", HyperbolicSpring),
 ]
 
+# structures spawned at the cursor with the number keys, see generators.GENERATORS
+structures = {
+    pygame.K_1: lambda at: ("chain", {"links": 20, "start": at}),
+    pygame.K_2: lambda at: ("lattice", {"rows": 10, "cols": 10, "center": at}),
+    pygame.K_3: lambda at: ("lattice", {"rows": 10, "cols": 10, "center": at, "triangular": True}),
+    pygame.K_4: lambda at: ("cloth", {"rows": 20, "cols": 20, "center": at}),
+}
+
 imgs = {}
 
 for name in os.listdir("imgs"):
@@ -46,10 +97,19 @@ for name in os.listdir("imgs"):
 
     imgs[name[:-4]] = pygame.image.load(path)
 
+# The selected entities of a snapshot, only their views get looked up
+def selection(snapshot) -> list:
+    return sim.get_entities(snapshot.anchor_uid[snapshot.anchor_selected], snapshot.spring_uid[snapshot.spring_selected])
+
 try: 
     while running:
         time_delta = clock.tick(60) / 1000.0
-        selected = [x for x in sim.entities if x.selected]
+        frame_start = time.perf_counter()
+        # only read the latest published state, the simulation keeps running meanwhile
+        snapshot = sim.snapshot
+        selected = selection(snapshot)
+        picker.update(snapshot)
+        step_history.append((frame_start, snapshot.step))
 
         # process events sent by pygame
         events = pygame.event.get()
@@ -63,10 +123,29 @@ try:
                     sim.toggle()
                     ui_show = not ui_show
 
+                if event.key == pygame.K_F3:
+                    hud_show = not hud_show
+
+                if event.key == pygame.K_LEFT:
+                    sim.rewind()
+
+                if event.key in structures:
+                    name, params = structures[event.key](tuple(render.untransform_point(mouse_pos)))
+                    params.update(stiffness=100, damping=0.5)
+                    if isinstance(sim, ProcessSimulation):
+                        sim.generate(name, **params)
+                    else:
+                        GENERATORS[name](sim, **params)
+
+                if event.key == pygame.K_s and event.mod & pygame.KMOD_CTRL:
+                    if isinstance(sim, ProcessSimulation):
+                        sim.save(scene_path, camera)
+                    else:
+                        scene.save(sim, scene_path, camera)
+                    print("saved scene to", scene_path)
+
                 if event.key == pygame.K_BACKSPACE:
-                    for entity in sim.entities[:]:
-                        if entity.selected and entity in sim.entities:
-                            sim.remove(entity)
+                    sim.remove_many(selected)
 
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 drag_start = time.time()
@@ -81,9 +160,7 @@ try:
                     rect = pygame.Rect((render.width - i, render.height - 64), (64, 64))
                     if rect.collidepoint(mouse_pos):
                         for i in range(len(selected) - 1):
-                            spring = spring(start=selected[i], end=selected[i+1])
-                            sim.springs.append(spring)
-                            sim.entities.append(spring)
+                            sim.add_spring(spring(start=selected[i], end=selected[i+1]))
                         break
 
                     i += 64
@@ -92,24 +169,28 @@ try:
                 if anchor_rect.collidepoint(mouse_pos):
                     if unselect:
                         sim.unselect()
-                    drag_anchor = Anchor(lock=True)
+                    drag_anchor = sim.add_anchor(Anchor(lock=True))
                     drag_anchor.selected = True
-                    sim.anchors.append(drag_anchor)
-                    sim.entities.append(drag_anchor)
-
-                for entity in sim.entities:
-                    if entity.clicked(render, mouse_pos):
-                        if unselect:
-                            sim.unselect()
-                        entity.selected = True
-                        if isinstance(entity, Anchor):
-                            entity.lock()
-                            drag_anchor = entity
-                        break
+
+                hit = picker.pick(render.untransform_point(mouse_pos))
+                entity = None
+                if hit is not None:
+                    kind, uid = hit
+                    entity = sim.get_anchor(uid) if kind == "anchor" else sim.get_spring(uid)
+                if entity is not None:
+                    if unselect:
+                        sim.unselect()
+                    entity.selected = True
+                    if isinstance(entity, Anchor):
+                        entity.lock()
+                        drag_anchor = entity
 
                 if drag_anchor is None:
-                    drag_mouse_start = mouse_pos
-                    drag_camera_start = camera.pos
+                    if pressed[pygame.K_LCTRL] or pressed[pygame.K_RCTRL]:
+                        box_start = mouse_pos
+                    else:
+                        drag_mouse_start = mouse_pos
+                        drag_camera_start = camera.pos
             
             if event.type == pygame.MOUSEMOTION:
                 if drag_anchor is not None:
@@ -125,6 +206,13 @@ try:
                         camera.pos = drag_camera_start + delta
                 
             if event.type == pygame.MOUSEBUTTONUP:
+                if box_start is not None:
+                    pressed = pygame.key.get_pressed()
+                    if not pressed[pygame.K_LSHIFT] and not pressed[pygame.K_RSHIFT]:
+                        sim.unselect()
+                    sim.select(*picker.select_box(render.untransform_point(box_start), render.untransform_point(mouse_pos)))
+                    box_start = None
+
                 if drag_mouse_start is not None:
                     if (drag_mouse_start - mouse_pos).magnitude_squared() < 10:
                         # unselect everything
@@ -146,32 +234,31 @@ try:
                 if entity_ui is not None:
                     entity_ui.resize(screen)
                 render.resize()
+        phase_start = time.perf_counter()
+        frame_profiler.add("events", phase_start - frame_start)
         
-        screen.fill("black")
-
-        render_grid(render)
-        
-        for spring in sim.springs:
-            spring.render(render)
-
-        for anchor in sim.anchors:
-            anchor.render(render)
+        with frame_profiler.measure("grid"):
+            screen.fill("black")
+            grid.draw(render)
+
+        with frame_profiler.measure("springs"):
+            draw_springs(render, snapshot)
+        with frame_profiler.measure("anchors"):
+            draw_anchors(render, snapshot)
+        phase_start = time.perf_counter()
+
+        if box_start is not None:
+            box = pygame.Rect(box_start, (0, 0))
+            box.union_ip(pygame.Rect(mouse_pos, (0, 0)))
+            pygame.draw.rect(screen, (0, 255, 100), box, 1)
         
         if len(selected) > 0 and isinstance(selected[0], Anchor):
             anchor = selected[0]
-            records.append(anchor.pos.copy())
-
-            if len(records) > 200:
-                records.pop(0)
-
-            if len(records) > 2:
-                recs = records[::-1]
-                x_records = [(pos.x, i / 300) for (i, pos) in enumerate(recs)]
-                y_records = [(i / 300, pos.y) for (i, pos) in enumerate(recs)]
-                render.draw_lines((255, 0, 0), False, x_records)
-                render.draw_vline((255, 0, 0), recs[0].x)
-                render.draw_lines((0, 0, 255), False, y_records)
-                render.draw_hline((0, 0, 255), recs[0].y)
+            if trail is None or trail.uid != anchor.uid:
+                trail = Trace(anchor.uid)
+            # one sample per drawn frame
+            trail.capture(snapshot.anchor_uid, snapshot.pos)
+            draw_trace(render, trail)
 
         # add images
         i = 64
@@ -201,10 +288,27 @@ try:
             settings_ui.update(events)
             if entity_ui is not None:
                 entity_ui.update(events)
-
-
+        frame_profiler.add("ui", time.perf_counter() - phase_start)
+
+        if hud_show:
+            (start, first), (end, last) = step_history[0], step_history[-1]
+            steps = (last - first) / (end - start) if end > start else 0.0
+            target = 0 if sim.paused() else sim.get_speed() / sim.timestep
+            lines = [
+                f"{clock.get_fps():.0f} fps  {steps:.0f} / {target:.0f} steps/s",
+                f"{snapshot.n_anchors} anchors  {snapshot.n_springs} springs",
+            ]
+            behind, dropped = sim.lag()
+            lines.append(f"{'behind' if behind else 'in time'}  {dropped:.2f}s dropped")
+            phases = list(frame_profiler.stats().items())
+            if isinstance(sim, Simulation):
+                # in process mode the step is timed in the other process
+                phases += [(f"step {name}", stats) for name, stats in sim.profiler.stats().items()]
+            lines += [f"{name:<16} {stats['p50_ms']:6.2f} {stats['p99_ms']:6.2f} ms" for name, stats in phases]
+            draw_text(screen, hud_font, lines, (10, 10))
 
         pygame.display.flip()
+        frame_profiler.add("frame", time.perf_counter() - frame_start)
 except KeyboardInterrupt:
     print("stopping...")
 
@@ -0,0 +1,619 @@
+from typing import Dict, List, Optional, Tuple
+from multiprocessing import shared_memory
+from engine import Engine, KERNELS, STRETCHED, LAW_CUSTOM
+from render import Camera
+from snapshot import Snapshot, ANCHOR_COLUMNS, SPRING_COLUMNS
+from sim import Simulation, Anchor, Spring, TIMESTEP, SIM_TO_REAL, RESTITUTION
+from generators import GENERATORS
+import scene
+import multiprocessing as mp
+import numpy as np
+import pygame
+import queue
+
+# one slot being written, one holding the latest state and one being read
+SLOTS = 3
+# position of the latest and the read slot in the shared header
+CURRENT, READING = 0, 1
+# position of the step, anchor count, spring count, last executed command, whether the
+# simulation fell behind and the microseconds of simulated time it dropped in a slot
+META_STEP, META_ANCHORS, META_SPRINGS, META_SEQ, META_BEHIND, META_DROPPED = range(6)
+# uids handed out by the render process start here to not collide with the simulation's own
+REMOTE_UID = 1 << 40
+# default number of anchors and springs the shared slots have room for
+MAX_ANCHORS = 16384
+MAX_SPRINGS = 65536
+
+# fields the render process may set and methods it may call on the simulated entities
+SETTABLE = {"pos", "vel", "selected", "stiffness", "rest_length", "damping", "max_force", "min_force"}
+CALLABLE = {"lock", "unlock", "set_mass", "set_static"}
+SIM_CALLABLE = {
+    "set_gravity", "set_gravity_enabled", "set_collisions", "set_restitution", "set_sleeping", "set_speed", "set_timestep", "set_integrator",
+    "unselect", "select", "pause", "resume", "record", "stop_recording", "rewind", "seek",
+    "fast_forward",
+}
+# commands which only append rows, so failing halfway leaves the rows appended so far to drop
+APPENDING = {"add_anchor", "add_spring", "generate"}
+
+# (name, dtype, shape) of every array in a slot
+def slot_layout(max_anchors: int, max_springs: int) -> List[Tuple[str, np.dtype, tuple]]:
+    engine = Engine()
+    layout = [("meta", np.dtype(np.int64), (6,))]
+    for columns, table, capacity in [
+        (ANCHOR_COLUMNS, engine.anchors, max_anchors),
+        (SPRING_COLUMNS, engine.springs, max_springs),
+    ]:
+        for name, column in columns.items():
+            dtype, shape = table.columns[column]
+            layout.append((name, np.dtype(dtype), (capacity, *shape)))
+    return layout
+
+# Maps the arrays of a layout onto a shared memory block without copying
+def map_layout(buf, layout) -> Dict[str, np.ndarray]:
+    arrays = {}
+    offset = 0
+    for name, dtype, shape in layout:
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+        # keep every array 8 byte aligned
+        offset += -(-int(np.prod(shape)) * dtype.itemsize // 8) * 8
+    return arrays
+
+def layout_size(layout) -> int:
+    return sum(-(-int(np.prod(shape)) * dtype.itemsize // 8) * 8 for _, dtype, shape in layout)
+
+# Triple buffered snapshots in shared memory, written by the simulation process
+# and read by the render process without locks or copies
+class SharedSlots:
+    names: List[str]
+    # whether the simulation fell behind and the simulated seconds it dropped
+    # as of the last acquired snapshot, see Simulation.lag
+    behind: bool
+    dropped: float
+
+    def __init__(self, max_anchors: int, max_springs: int, names: Optional[List[str]] = None):
+        self.max_anchors = max_anchors
+        self.max_springs = max_springs
+        self.layout = slot_layout(max_anchors, max_springs)
+        self.owner = names is None
+        self.behind = False
+        self.dropped = 0.0
+        if self.owner:
+            self.blocks = [shared_memory.SharedMemory(create=True, size=16)]
+            self.blocks += [shared_memory.SharedMemory(create=True, size=layout_size(self.layout)) for _ in range(SLOTS)]
+        else:
+            self.blocks = [shared_memory.SharedMemory(name=name) for name in names]
+        self.names = [block.name for block in self.blocks]
+        self.header = np.ndarray((2,), dtype=np.int64, buffer=self.blocks[0].buf)
+        self.slots = [map_layout(block.buf, self.layout) for block in self.blocks[1:]]
+        if self.owner:
+            self.header[:] = 0
+            for slot in self.slots:
+                slot["meta"][:] = 0
+
+    # Copies the state of an engine into a free slot and makes it the latest one
+    def write(self, engine: Engine, step: int, seq: int, behind: bool = False, dropped: float = 0):
+        n, m = engine.anchors.size, engine.springs.size
+        busy = {int(self.header[CURRENT]), int(self.header[READING])}
+        index = next(i for i in range(SLOTS) if i not in busy)
+        slot = self.slots[index]
+        for columns, table, size in [(ANCHOR_COLUMNS, engine.anchors, n), (SPRING_COLUMNS, engine.springs, m)]:
+            for name, column in columns.items():
+                slot[name][:size] = getattr(table, column)[:size]
+        slot["meta"][:] = (step, n, m, seq, behind, round(dropped * 1e6))
+        self.header[CURRENT] = index
+
+    # Returns the latest snapshot and the last command it reflects.
+    # The snapshot stays valid until the next call.
+    def acquire(self) -> Tuple[Snapshot, int]:
+        while True:
+            index = int(self.header[CURRENT])
+            self.header[READING] = index
+            # the writer might have moved on before it saw our claim
+            if int(self.header[CURRENT]) == index:
+                break
+        slot = self.slots[index]
+        step, n, m, seq, behind, dropped = (int(x) for x in slot["meta"])
+        self.behind = bool(behind)
+        self.dropped = dropped / 1e6
+        columns = {}
+        for name in ANCHOR_COLUMNS:
+            columns[name] = slot[name][:n]
+        for name in SPRING_COLUMNS:
+            columns[name] = slot[name][:m]
+        return Snapshot(step, **columns), seq
+
+    def close(self):
+        self.header = None
+        self.slots = []
+        for block in self.blocks:
+            block.close()
+            if self.owner:
+                block.unlink()
+
+def _values(entity) -> dict:
+    values = {}
+    for name in entity.fields():
+        if name in ("start", "end") or not hasattr(entity, name):
+            continue
+        value = getattr(entity, name)
+        values[name] = tuple(value) if isinstance(value, pygame.Vector2) else value
+    return values
+
+def _create(cls, values: dict):
+    entity = cls.__new__(cls)
+    for name, value in values.items():
+        setattr(entity, name, value)
+    return entity
+
+# Looks up an entity by ("anchor" | "spring", uid), None if it is gone,
+# e.g. because it got culled meanwhile
+def _find(sim: Simulation, key: Tuple[str, int]):
+    kind, uid = key
+    return sim.get_anchor(uid) if kind == "anchor" else sim.get_spring(uid)
+
+def _execute(sim: Simulation, command: tuple):
+    kind, args = command[0], command[1:]
+    if kind == "add_anchor":
+        uid, values = args
+        sim.add_anchor(_create(Anchor, values), uid)
+    elif kind == "add_spring":
+        uid, type_name, start, end, values = args
+        spring = _create(scene.spring_class(type_name), values)
+        spring.start = _find(sim, ("anchor", start))
+        spring.end = _find(sim, ("anchor", end))
+        if spring.start is not None and spring.end is not None:
+            sim.add_spring(spring, uid)
+    elif kind == "sim":
+        method, method_args = args
+        if method in SIM_CALLABLE:
+            getattr(sim, method)(*method_args)
+    elif kind == "load":
+        scene.load(sim, args[0])
+    elif kind == "save":
+        path, camera = args
+        scene.save(sim, path, None if camera is None else Camera(*camera))
+    elif kind == "generate":
+        name, params = args
+        if name in GENERATORS:
+            GENERATORS[name](sim, **params)
+    elif kind == "remove_many":
+        # looked up all at once, the ones gone meanwhile get left out
+        engine = sim.engine
+        anchors = [uid for kind, uid in args[0] if kind == "anchor"]
+        springs = [uid for kind, uid in args[0] if kind == "spring"]
+        with sim.lock:
+            sim.remove_springs(np.flatnonzero(np.isin(engine.springs.uid[:engine.springs.size], springs)))
+            sim.remove_anchors(np.flatnonzero(np.isin(engine.anchors.uid[:engine.anchors.size], anchors)))
+    else:
+        entity = _find(sim, args[0])
+        if entity is None:
+            return
+        if kind == "remove":
+            sim.remove(entity)
+        elif kind == "set" and args[1] in SETTABLE:
+            setattr(entity, args[1], args[2])
+        elif kind == "call" and args[1] in CALLABLE:
+            getattr(entity, args[1])(*args[2])
+
+# Removes the rows appended after the given numbers of anchors and springs
+def _drop_rows(sim: Simulation, anchors: int, springs: int):
+    sim.remove_springs(np.arange(springs, sim.engine.springs.size))
+    sim.remove_anchors(np.arange(anchors, sim.engine.anchors.size))
+
+# Main loop of the simulation process
+def _serve(names: List[str], max_anchors: int, max_springs: int, commands, scene_dict: Optional[dict]):
+    slots = SharedSlots(max_anchors, max_springs, names)
+    sim = Simulation()
+    if scene_dict is not None:
+        scene.from_dict(sim, scene_dict)
+    seq = 0
+    running = True
+    sim.scheduler.reset()
+    while running:
+        timeout = TIMESTEP if sim.paused() else sim.scheduler.remaining()
+        try:
+            command = commands.get(timeout=timeout)
+            while True:
+                seq = command[0]
+                if command[1] == "stop":
+                    running = False
+                    break
+                anchors, springs = sim.engine.anchors.size, sim.engine.springs.size
+                # a command which fails gets dropped, the simulation carries on without it
+                try:
+                    if command[1] in ("add_anchor", "add_spring") and (anchors >= max_anchors or springs >= max_springs):
+                        print("simulation process is full, dropping", command[1])
+                    elif command[1] == "load" and not all(
+                            np.less_equal(scene.read_sizes(command[2]), (max_anchors, max_springs))):
+                        print("scene does not fit into the simulation process, dropping it")
+                    else:
+                        _execute(sim, command[1:])
+                        if sim.engine.anchors.size > max_anchors or sim.engine.springs.size > max_springs:
+                            print("simulation process is full, dropping", command[1])
+                            # the other commands only append rows, so dropping them leaves the scene as it was
+                            _drop_rows(sim, anchors, springs)
+                except Exception as error:
+                    print(f"simulation process failed to run {command[1]}, dropping it: {error!r}")
+                    if command[1] in APPENDING:
+                        _drop_rows(sim, anchors, springs)
+                command = commands.get_nowait()
+        except queue.Empty:
+            pass
+
+        if sim.paused():
+            sim.scheduler.reset()
+        else:
+            sim.scheduler.tick()
+        slots.write(sim.engine, sim.step_count, seq, sim.scheduler.fell_behind(), sim.scheduler.dropped)
+    sim.stop_recording()
+    slots.close()
+
+# A field of a remote entity, read from the latest snapshot and written as a command
+class RemoteField:
+    def __init__(self, name: str, attr: str, vector=False, none=None):
+        # name of the field on the simulated entity
+        self.name = name
+        # name of the snapshot column
+        self.attr = attr
+        self.vector = vector
+        self.none = none
+
+    def __get__(self, proxy, owner=None):
+        if proxy is None:
+            return self
+        sim = proxy._sim
+        if self.name in proxy._pending:
+            value, seq = proxy._pending[self.name]
+            if seq > sim._seen:
+                return value
+            del proxy._pending[self.name]
+
+        row = sim.row(proxy)
+        if row is None:
+            return proxy._last.get(self.name)
+        value = getattr(sim.current, self.attr)[row]
+        if self.vector:
+            value = pygame.Vector2(value.tolist())
+        else:
+            value = value.item()
+            if self.none is not None and value == self.none:
+                value = None
+        proxy._last[self.name] = value
+        return value
+
+    def __set__(self, proxy, value):
+        if isinstance(value, pygame.Vector2):
+            value = tuple(value)
+        seq = proxy._sim.send("set", proxy.key, self.name, value)
+        # show the new value until the simulation process caught up
+        proxy._pending[self.name] = (pygame.Vector2(value) if self.vector else value, seq)
+
+# Stands in for an entity living in the simulation process
+class Remote:
+    _sim: 'ProcessSimulation'
+    _uid: int
+    kind: str
+
+    def __init__(self, sim: 'ProcessSimulation', uid: int):
+        self._sim = sim
+        self._uid = uid
+        self._pending = {}
+        self._last = {}
+
+    @property
+    def uid(self):
+        return self._uid
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return self.kind, self._uid
+
+    def call(self, method: str, *args):
+        self._sim.send("call", self.key, method, args)
+
+class RemoteAnchor(Remote, Anchor):
+    kind = "anchor"
+    pos = RemoteField("pos", "pos", vector=True)
+    vel = RemoteField("vel", "vel", vector=True)
+    radius = RemoteField("radius", "radius")
+    selected = RemoteField("selected", "anchor_selected")
+    _mass = RemoteField("_mass", "mass")
+    _static = RemoteField("_static", "static")
+    _lock = RemoteField("_lock", "locked")
+
+    def lock(self):
+        self.call("lock")
+
+    def unlock(self):
+        self.call("unlock")
+
+    def set_mass(self, val: float):
+        self.call("set_mass", val)
+
+    def set_static(self, val: bool):
+        self.call("set_static", val)
+
+# A spring end, stored as an index into the anchors of the snapshot
+class RemoteAnchorField(RemoteField):
+    def __get__(self, proxy, owner=None):
+        if proxy is None:
+            return self
+        sim = proxy._sim
+        row = sim.row(proxy)
+        if row is None:
+            return proxy._last.get(self.name)
+        anchor = sim.proxy(RemoteAnchor, int(sim.current.anchor_uid[getattr(sim.current, self.attr)[row]]))
+        proxy._last[self.name] = anchor
+        return anchor
+
+class RemoteSpring(Remote, Spring):
+    kind = "spring"
+    start = RemoteAnchorField("start", "start")
+    end = RemoteAnchorField("end", "end")
+    stiffness = RemoteField("stiffness", "stiffness")
+    rest_length = RemoteField("rest_length", "rest_length")
+    damping = RemoteField("damping", "damping")
+    max_force = RemoteField("max_force", "max_force", none=np.inf)
+    min_force = RemoteField("min_force", "min_force", none=-np.inf)
+    selected = RemoteField("selected", "spring_selected")
+
+    # law of the spring in the latest snapshot, LAW_CUSTOM if it isn't in there
+    def snapshot_law(self) -> int:
+        row = self._sim.row(self)
+        return LAW_CUSTOM if row is None else int(self._sim.current.law[row])
+
+    @property
+    def stretched(self) -> bool:
+        law = self.snapshot_law()
+        return law == LAW_CUSTOM or STRETCHED[law]
+
+    # The kernel of its law evaluated here, custom laws only exist in the simulation process
+    def magnitude(self, dist: float) -> float:
+        law = self.snapshot_law()
+        if law == LAW_CUSTOM:
+            raise ValueError("springs with a custom law are evaluated in the simulation process")
+        return float(KERNELS[law](np.array([dist]), np.array([self.stiffness]))[0])
+
+# Runs the physics in a child process, so it doesn't share the GIL with rendering.
+# The state is published into shared memory, edits are sent over a command queue.
+# Mirrors the interface of Simulation used by the UI.
+class ProcessSimulation:
+    gravity: pygame.Vector2
+    gravity_enabled: bool
+    # latest acquired snapshot
+    current: Snapshot
+
+    def __init__(self, scene_dict: Optional[dict] = None, max_anchors: int = MAX_ANCHORS, max_springs: int = MAX_SPRINGS):
+        # forking keeps the caller from having to guard its module against re-import
+        method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        context = mp.get_context(method)
+        self.slots = SharedSlots(max_anchors, max_springs)
+        self.commands = context.Queue()
+        self.process = context.Process(
+            target=_serve,
+            args=(self.slots.names, max_anchors, max_springs, self.commands, scene_dict),
+            daemon=True,
+        )
+        self.gravity = pygame.Vector2(0, -9.81)
+        self.gravity_enabled = True
+        if scene_dict is not None:
+            self.gravity = pygame.Vector2(scene_dict.get("gravity", self.gravity))
+            self.gravity_enabled = scene_dict.get("gravity_enabled", True)
+        self.speed = SIM_TO_REAL
+        self.timestep = TIMESTEP
+        self.collisions = False
+        self.restitution = RESTITUTION
+        self.sleeping = True
+        self._paused = False
+        self._seq = 0
+        # last command reflected in the current snapshot
+        self._seen = 0
+        self._next_uid = REMOTE_UID
+        self._proxies = {}
+        self._rows = None
+        self.current = None
+
+    def start(self):
+        self.process.start()
+
+    def stop(self):
+        if self.process.is_alive():
+            self.send("stop")
+            self.process.join(1)
+        self.current = None
+        self.slots.close()
+
+    def send(self, *command) -> int:
+        self._seq += 1
+        self.commands.put((self._seq, *command))
+        return self._seq
+
+    def call(self, method: str, *args) -> int:
+        return self.send("sim", method, args)
+
+    def toggle(self):
+        if self._paused:
+            self.resume()
+        else:
+            self.pause()
+
+    def pause(self):
+        self._paused = True
+        self.call("pause")
+
+    def resume(self):
+        self._paused = False
+        self.call("resume")
+
+    def paused(self):
+        return self._paused
+
+    def get_speed(self) -> float:
+        return self.speed
+
+    def set_speed(self, val: float):
+        self.speed = val
+        self.call("set_speed", val)
+
+    def set_gravity(self, val):
+        self.gravity = pygame.Vector2(val)
+        self.call("set_gravity", tuple(self.gravity))
+
+    def set_gravity_enabled(self, val: bool):
+        self.gravity_enabled = val
+        self.call("set_gravity_enabled", val)
+
+    def set_collisions(self, val: bool):
+        self.collisions = val
+        self.call("set_collisions", val)
+
+    def set_restitution(self, val: float):
+        self.restitution = val
+        self.call("set_restitution", val)
+
+    def set_sleeping(self, val: bool):
+        self.sleeping = val
+        self.call("set_sleeping", val)
+
+    def set_timestep(self, val: float):
+        self.timestep = val
+        self.call("set_timestep", val)
+
+    def set_integrator(self, name: str):
+        self.call("set_integrator", name)
+
+    # Starts recording in the simulation process, see Simulation.record
+    def record(self, path: Optional[str] = None, uids=None, every: int = 1, capacity: int = 4096):
+        self.call("record", path, None if uids is None else list(map(int, uids)), every, capacity)
+
+    def stop_recording(self):
+        self.call("stop_recording")
+
+    # Goes back in the simulation process, see Simulation.seek and rewind. The
+    # settings mirrored here keep their values, so they only match again once set.
+    def seek(self, step: int):
+        self.call("seek", step)
+
+    def rewind(self):
+        self.call("rewind")
+
+    # Fast forwards in the simulation process, see Simulation.fast_forward.
+    # It never waits, the snapshots jump ahead once it is done.
+    def fast_forward(self, seconds: float, until_rest: bool = False, wait: bool = False):
+        self.call("fast_forward", seconds, until_rest)
+
+    # The latest published state, valid until the next access
+    @property
+    def snapshot(self) -> Snapshot:
+        self.current, self._seen = self.slots.acquire()
+        self._rows = None
+        return self.current
+
+    # Whether the simulation process fell behind and the simulated seconds it dropped
+    # as of the latest snapshot, see Simulation.lag
+    def lag(self) -> Tuple[bool, float]:
+        if self.current is None:
+            self.snapshot
+        return self.slots.behind, self.slots.dropped
+
+    # row of a remote entity in the current snapshot, None if it is gone
+    def row(self, proxy: Remote) -> Optional[int]:
+        if self.current is None:
+            self.snapshot
+        if self._rows is None:
+            self._rows = {}
+            for cls, uids in [(RemoteAnchor, self.current.anchor_uid), (RemoteSpring, self.current.spring_uid)]:
+                for row, uid in enumerate(uids.tolist()):
+                    self._rows[cls, uid] = row
+        return self._rows.get((type(proxy), proxy._uid))
+
+    def proxy(self, cls, uid: int) -> Remote:
+        proxy = self._proxies.get((cls, uid))
+        if proxy is None:
+            proxy = self._proxies[cls, uid] = cls(self, uid)
+        return proxy
+
+    @property
+    def anchors(self) -> List[RemoteAnchor]:
+        if self.current is None:
+            self.snapshot
+        return [self.proxy(RemoteAnchor, uid) for uid in self.current.anchor_uid.tolist()]
+
+    @property
+    def springs(self) -> List[RemoteSpring]:
+        if self.current is None:
+            self.snapshot
+        return [self.proxy(RemoteSpring, uid) for uid in self.current.spring_uid.tolist()]
+
+    @property
+    def entities(self) -> list:
+        return self.anchors + self.springs
+
+    def add_anchor(self, anchor: Anchor) -> RemoteAnchor:
+        if isinstance(anchor, RemoteAnchor):
+            return anchor
+        uid = self._next_uid
+        self._next_uid += 1
+        self.send("add_anchor", uid, _values(anchor))
+        return self.proxy(RemoteAnchor, uid)
+
+    def add_spring(self, spring: Spring) -> RemoteSpring:
+        if isinstance(spring, RemoteSpring):
+            return spring
+        start = self.add_anchor(spring.start)
+        end = self.add_anchor(spring.end)
+        uid = self._next_uid
+        self._next_uid += 1
+        self.send("add_spring", uid, type(spring).__name__, start.uid, end.uid, _values(spring))
+        return self.proxy(RemoteSpring, uid)
+
+    def add(self, entity):
+        if isinstance(entity, Anchor):
+            return self.add_anchor(entity)
+        elif isinstance(entity, Spring):
+            return self.add_spring(entity)
+
+    # Replaces the scene with the one saved at path, see scene.load
+    def load(self, path: str, camera: Optional[Camera] = None):
+        settings = scene.read_settings(path)
+        self.gravity = pygame.Vector2(settings["gravity"])
+        self.gravity_enabled = settings["gravity_enabled"]
+        if camera is not None and "camera_pos" in settings:
+            camera.pos = pygame.Vector2(settings["camera_pos"])
+            camera.zoom = settings["camera_zoom"]
+        self.send("load", path)
+
+    def save(self, path: str, camera: Optional[Camera] = None):
+        self.send("save", path, None if camera is None else (tuple(camera.pos), camera.zoom))
+
+    # Generates a structure in the simulation process, see generators.GENERATORS
+    def generate(self, name: str, **params):
+        self.send("generate", name, params)
+
+    def remove(self, entity: Remote):
+        self.send("remove", entity.key)
+
+    def remove_many(self, entities: List[Remote]):
+        self.send("remove_many", [entity.key for entity in entities])
+
+    def unselect(self):
+        seq = self.call("unselect")
+        for proxy in self._proxies.values():
+            proxy._pending["selected"] = (False, seq)
+
+    def select(self, anchors, springs):
+        anchors, springs = list(map(int, anchors)), list(map(int, springs))
+        seq = self.call("select", anchors, springs)
+        for cls, uids in [(RemoteAnchor, anchors), (RemoteSpring, springs)]:
+            for uid in uids:
+                self.proxy(cls, uid)._pending["selected"] = (True, seq)
+
+    def get_entities(self, anchor_uids, spring_uids) -> list:
+        return [self.proxy(RemoteAnchor, uid) for uid in np.asarray(anchor_uids).tolist()] \
+            + [self.proxy(RemoteSpring, uid) for uid in np.asarray(spring_uids).tolist()]
+
+    def get_anchor(self, uid: int) -> RemoteAnchor:
+        return self.proxy(RemoteAnchor, uid)
+
+    def get_spring(self, uid: int) -> RemoteSpring:
+        return self.proxy(RemoteSpring, uid)
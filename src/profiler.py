@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+from typing import Dict
+import numpy as np
+import time
+
+# number of samples the statistics of a phase are taken over
+WINDOW = 512
+
+# The durations of the last WINDOW runs of a phase and when they ended
+class Timings:
+    durations: np.ndarray
+    ends: np.ndarray
+    # runs so far
+    count: int
+
+    def __init__(self, window: int = WINDOW):
+        self.durations = np.zeros(window)
+        self.ends = np.zeros(window)
+        self.count = 0
+
+    def add(self, duration: float, end: float):
+        index = self.count % len(self.durations)
+        self.durations[index] = duration
+        self.ends[index] = end
+        self.count += 1
+
+    def samples(self) -> np.ndarray:
+        return self.durations[:min(self.count, len(self.durations))]
+
+    # runs per second over the window
+    def rate(self) -> float:
+        n = min(self.count, len(self.ends))
+        if n < 2:
+            return 0.0
+        ends = self.ends[:n]
+        span = ends.max() - ends.min()
+        return float((n - 1) / span) if span > 0 else 0.0
+
+# Rolling timings of named phases, e.g. the passes of a simulation step
+# or the stages of a frame. Cheap enough to stay enabled all the time.
+class Profiler:
+    phases: Dict[str, Timings]
+
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self.phases = {}
+
+    def add(self, name: str, duration: float):
+        timings = self.phases.get(name)
+        if timings is None:
+            timings = self.phases[name] = Timings(self.window)
+        timings.add(duration, time.perf_counter())
+
+    # Times the body of the with statement as the given phase
+    @contextmanager
+    def measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    # runs per second of a phase
+    def rate(self, name: str) -> float:
+        timings = self.phases.get(name)
+        return 0.0 if timings is None else timings.rate()
+
+    # p50, p99, mean and max of every phase in milliseconds, and its runs per second
+    def stats(self) -> Dict[str, dict]:
+        stats = {}
+        for name, timings in list(self.phases.items()):
+            samples = timings.samples() * 1000
+            if len(samples) == 0:
+                continue
+            p50, p99 = np.percentile(samples, [50, 99])
+            stats[name] = {
+                "p50_ms": float(p50),
+                "p99_ms": float(p99),
+                "mean_ms": float(samples.mean()),
+                "max_ms": float(samples.max()),
+                "count": timings.count,
+                "rate": timings.rate(),
+            }
+        return stats
+
+    def reset(self):
+        self.phases = {}
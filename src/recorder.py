@@ -0,0 +1,140 @@
+from typing import Optional
+import numpy as np
+import queue
+import threading
+
+# size of the header of a recorded file, large enough to be rewritten with the final frame count
+HEADER_SIZE = 256
+
+# One recorded frame: the step it was taken at and the state of every tracked anchor
+def frame_dtype(anchors: int) -> np.dtype:
+    return np.dtype([
+        ("step", np.int64),
+        ("pos", np.float64, (anchors, 2)),
+        ("vel", np.float64, (anchors, 2)),
+    ])
+
+# .npy header of an array of frames, padded to HEADER_SIZE
+def npy_header(dtype: np.dtype, frames: int) -> bytes:
+    text = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (frames,)})
+    # magic, version and header length take 10 bytes, the header ends with a newline
+    text = text.ljust(HEADER_SIZE - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + len(text).to_bytes(2, "little") + text.encode("latin1")
+
+# Rows of the given uids in a uid column, -1 for the ones which aren't in there
+def lookup(uids: np.ndarray, uid: np.ndarray) -> np.ndarray:
+    rows = np.full(len(uids), -1, dtype=np.intp)
+    order = np.argsort(uid)
+    at = np.searchsorted(uid, uids, sorter=order)
+    inside = np.flatnonzero(at < len(uid))
+    candidates = order[at[inside]]
+    hit = uid[candidates] == uids[inside]
+    rows[inside[hit]] = candidates[hit]
+    return rows
+
+# Records the positions and velocities of a fixed set of anchors into a ring buffer
+# of preallocated frames. With a path, full chunks of the ring get appended to an
+# .npy file by a background thread, so recording never waits on the disk and
+# memory stays bounded however long the run. Anchors which are gone are NaN.
+#
+# The file holds an array of frame_dtype records, np.load(path)["pos"] is
+# a (frames, anchors, 2) array.
+class Recorder:
+    uids: np.ndarray
+    # record every n-th step
+    every: int
+    # frames written to the ring so far
+    count: int
+    # frames written to the file so far
+    flushed: int
+    # frames dropped because the writer fell behind by a whole ring
+    dropped: int
+
+    def __init__(self, uids, every: int = 1, capacity: int = 4096, path: Optional[str] = None, chunk: Optional[int] = None):
+        self.uids = np.array(uids, dtype=np.int64)
+        self.every = every
+        self.chunk = chunk or max(1, capacity // 4)
+        # whole chunks, so a chunk never wraps around the end of the ring
+        capacity = -(-capacity // self.chunk) * self.chunk
+        self.frames = np.zeros(capacity, dtype=frame_dtype(len(self.uids)))
+        self.count = 0
+        self.flushed = 0
+        self.dropped = 0
+        # rows of the tracked anchors in the engine the last time they were looked up
+        self.rows = np.arange(len(self.uids))
+
+        self.path = path
+        self.file = None
+        if path is not None:
+            self.file = open(path, "wb")
+            self.file.write(npy_header(self.frames.dtype, 0))
+            # end of the frames to write, None to stop
+            self.pending = queue.Queue()
+            self.writer = threading.Thread(target=self.write, daemon=True)
+            self.writer.start()
+
+    # Looks up the rows of the tracked anchors, -1 for the ones which are gone.
+    # Rows only move when anchors get removed and uids are never reused,
+    # so the last lookup is usually still right.
+    def find(self, uid: np.ndarray) -> np.ndarray:
+        rows = self.rows
+        known = rows >= 0
+        if np.all(rows[known] < len(uid)) and np.array_equal(uid[rows[known]], self.uids[known]):
+            return rows
+
+        self.rows = lookup(self.uids, uid)
+        return self.rows
+
+    # Records a frame given the uid, pos and vel columns of all anchors
+    def capture(self, uid: np.ndarray, pos: np.ndarray, vel: np.ndarray, step: int):
+        if step % self.every != 0:
+            return
+        if self.file is not None and self.count - self.flushed >= len(self.frames):
+            self.dropped += 1
+            return
+
+        index = self.count % len(self.frames)
+        rows = self.find(uid)
+        found = rows >= 0
+        self.frames["step"][index] = step
+        for name, column in [("pos", pos), ("vel", vel)]:
+            frame = self.frames[name][index]
+            frame[found] = column[rows[found]]
+            frame[~found] = np.nan
+        self.count += 1
+
+        if self.file is not None and self.count % self.chunk == 0:
+            self.pending.put(self.count)
+
+    # Writer thread appending the frames up to the requested count to the file
+    def write(self):
+        while True:
+            end = self.pending.get()
+            if end is None:
+                return
+            capacity = len(self.frames)
+            while self.flushed < end:
+                start = self.flushed % capacity
+                stop = min(capacity, start + end - self.flushed)
+                self.file.write(self.frames[start:stop].tobytes())
+                self.flushed += stop - start
+
+    # The frames still in the ring, oldest first
+    def latest(self) -> np.ndarray:
+        capacity = len(self.frames)
+        if self.count <= capacity:
+            return self.frames[:self.count].copy()
+        start = self.count % capacity
+        return np.concatenate([self.frames[start:], self.frames[:start]])
+
+    # Writes the remaining frames and finishes the file
+    def close(self):
+        if self.file is None:
+            return
+        self.pending.put(self.count)
+        self.pending.put(None)
+        self.writer.join()
+        self.file.seek(0)
+        self.file.write(npy_header(self.frames.dtype, self.flushed))
+        self.file.close()
+        self.file = None
@@ -1,4 +1,5 @@
 import pygame
+import numpy as np
 
 class Camera:
     # world pos of camera
@@ -98,6 +99,19 @@ class Render:
     def transform_point(self, point: pygame.Vector2) -> pygame.Vector2:
         return self.offset + self.pixels * self.camera.transform_point(point)
     
+    # transforms an (n, 2) array of points into screen coords
+    def transform_points(self, points: np.ndarray) -> np.ndarray:
+        scale = self.pixels * self.camera.zoom
+        camera = np.array((self.camera.pos.x, self.camera.pos.y))
+        return (points - camera) * (scale, -scale) + (self.offset.x, self.offset.y)
+
+    # world coords of the bottom left and top right corners of the screen
+    def visible_rect(self) -> tuple:
+        scale = self.pixels * self.camera.zoom
+        lo = (self.camera.pos.x - self.offset.x / scale, self.camera.pos.y - (self.height - self.offset.y) / scale)
+        hi = (self.camera.pos.x + (self.width - self.offset.x) / scale, self.camera.pos.y + self.offset.y / scale)
+        return lo, hi
+
     def transform_x(self, x: float) -> float:
         return self.offset.x + self.pixels * self.camera.transform_x(x)
     
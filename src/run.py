@@ -0,0 +1,65 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from sim import Simulation, TIMESTEP
+from integrators import INTEGRATORS
+from recorder import lookup
+import scene
+import numpy as np
+import argparse
+import time
+
+# Runs a scene without a window as fast as possible
+def main():
+    parser = argparse.ArgumentParser(description="Run an oscsim scene headless")
+    parser.add_argument("scene", help="scene to simulate (.json or .npz)")
+    parser.add_argument("--steps", type=float, default=1000, help="number of steps to simulate")
+    parser.add_argument("--output", "-o", help="where to write the final scene to")
+    parser.add_argument("--trajectory", "-t", help="where to write the anchor positions to (.npy)")
+    parser.add_argument("--every", type=int, default=1, help="record the trajectory every n steps")
+    parser.add_argument("--integrator", choices=list(INTEGRATORS), default="euler", help="integration method")
+    parser.add_argument("--timestep", type=float, default=TIMESTEP, help="simulated seconds per step")
+    parser.add_argument("--scalar", action="store_true", help="step the anchors one by one instead of batched")
+    args = parser.parse_args()
+
+    steps = int(args.steps)
+    sim = Simulation(vectorized=not args.scalar)
+    sim.set_integrator(args.integrator)
+    sim.set_timestep(args.timestep)
+    scene.load(sim, args.scene)
+
+    trajectory = None
+    if args.trajectory is not None:
+        # anchors may leave the scene, their positions are NaN from then on.
+        # They are followed by uid, as their rows move when others get removed.
+        tracked = sim.engine.anchors.uid[:sim.engine.anchors.size].copy()
+        indices = np.arange(len(tracked))
+        frames = steps // args.every + 1
+        trajectory = np.lib.format.open_memmap(
+            args.trajectory, mode="w+", dtype=np.float64, shape=(frames, len(tracked), 2))
+        trajectory[0] = sim.engine.anchors.pos[indices]
+        size = len(tracked)
+
+    start = time.perf_counter()
+    for step in range(1, steps + 1):
+        sim.update()
+
+        if trajectory is not None and step % args.every == 0:
+            if sim.engine.anchors.size != size:
+                size = sim.engine.anchors.size
+                indices = lookup(tracked, sim.engine.anchors.uid[:size])
+            frame = trajectory[step // args.every]
+            frame[:] = sim.engine.anchors.pos[indices]
+            frame[indices < 0] = np.nan
+    elapsed = time.perf_counter() - start
+
+    if trajectory is not None:
+        trajectory.flush()
+    if args.output is not None:
+        scene.save(sim, args.output)
+
+    print(f"{steps} steps ({steps * sim.timestep:g}s simulated) in {elapsed:.3f}s, "
+          f"{steps / elapsed if elapsed > 0 else float('inf'):.0f} steps/s")
+
+if __name__ == "__main__":
+    main()
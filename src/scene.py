@@ -0,0 +1,216 @@
+from typing import Dict, List, Optional, Tuple, Type
+from engine import LAW_CUSTOM
+from render import Camera
+from sim import Simulation, Spring, law_id, law_class
+import pygame
+import numpy as np
+import json
+
+# Looks up a spring class by its name, including user defined springs
+def spring_class(name: str) -> Type[Spring]:
+    classes = [Spring]
+    while classes:
+        cls = classes.pop()
+        if cls.__name__ == name:
+            return cls
+        classes.extend(cls.__subclasses__())
+    raise ValueError(f"unknown spring type: {name}")
+
+# Class names of the springs as (names, index into names of every spring)
+def spring_types(sim: Simulation) -> Tuple[List[str], np.ndarray]:
+    springs = sim.engine.springs
+    law = springs.law[:springs.size]
+    # springs without a view yet are of the class of their law
+    names = [law_class(i).__name__ for i in np.unique(law[law != LAW_CUSTOM]).tolist()]
+    types = np.zeros(springs.size, dtype=np.intp)
+    for i, name in enumerate(names):
+        types[law == law_id(spring_class(name))] = i
+    for index, view in enumerate(springs.views):
+        if view is None:
+            continue
+        name = type(view).__name__
+        if name not in names:
+            names.append(name)
+        types[index] = names.index(name)
+    return names, types
+
+# The scene as flat arrays, one entry per anchor or spring
+def to_arrays(sim: Simulation, camera: Optional[Camera] = None) -> Dict[str, np.ndarray]:
+    with sim.lock:
+        anchors, springs = sim.engine.anchors, sim.engine.springs
+        n, m = anchors.size, springs.size
+        names, types = spring_types(sim)
+        arrays = {
+            "gravity": np.array(sim.gravity),
+            "gravity_enabled": np.array(sim.gravity_enabled),
+            "anchor_pos": anchors.pos[:n].copy(),
+            "anchor_vel": anchors.vel[:n].copy(),
+            "anchor_mass": anchors.mass[:n].copy(),
+            "anchor_static": anchors.static[:n].copy(),
+            "spring_types": np.array(names, dtype=str),
+            "spring_type": types,
+            "spring_start": springs.start[:m].copy(),
+            "spring_end": springs.end[:m].copy(),
+            "spring_stiffness": springs.stiffness[:m].copy(),
+            "spring_rest_length": springs.rest_length[:m].copy(),
+            "spring_damping": springs.damping[:m].copy(),
+            "spring_max_force": springs.max_force[:m].copy(),
+            "spring_min_force": springs.min_force[:m].copy(),
+        }
+    if camera is not None:
+        arrays["camera_pos"] = np.array(camera.pos)
+        arrays["camera_zoom"] = np.array(camera.zoom)
+    return arrays
+
+# Replaces the scene of the simulation with the given arrays. They get copied
+# straight into the engine, the entity objects are only created once needed.
+def from_arrays(sim: Simulation, arrays, camera: Optional[Camera] = None):
+    with sim.lock:
+        sim.clear()
+        sim.gravity.update(arrays["gravity"].tolist())
+        sim.gravity_enabled = bool(arrays["gravity_enabled"])
+
+        engine = sim.engine
+        engine.add_anchors(arrays["anchor_pos"], arrays["anchor_vel"], arrays["anchor_mass"], arrays["anchor_static"])
+
+        classes = [spring_class(name) for name in arrays["spring_types"].tolist()]
+        laws = np.array([law_id(cls) for cls in classes], dtype=np.int8)
+        types = arrays["spring_type"]
+        first = engine.add_springs(
+            arrays["spring_start"],
+            arrays["spring_end"],
+            laws[types] if len(types) else 0,
+            arrays["spring_stiffness"],
+            arrays["spring_max_force"],
+            arrays["spring_min_force"],
+            # scenes saved before springs had them
+            arrays["spring_rest_length"] if "spring_rest_length" in arrays else 0,
+            arrays["spring_damping"] if "spring_damping" in arrays else 0,
+        )
+        # springs which aren't of the class of their law need their view right away
+        for i, cls in enumerate(classes):
+            if laws[i] != LAW_CUSTOM and law_class(laws[i]) is cls:
+                continue
+            for index in (first + np.flatnonzero(types == i)).tolist():
+                engine.springs.views[index] = cls.attach(engine, engine.springs, index)
+        sim.integrator.reset()
+
+    if camera is not None and "camera_pos" in arrays:
+        camera.pos = pygame.Vector2(arrays["camera_pos"].tolist())
+        camera.zoom = float(arrays["camera_zoom"])
+
+def to_dict(sim: Simulation, camera: Optional[Camera] = None) -> dict:
+    arrays = to_arrays(sim, camera)
+    names = arrays["spring_types"].tolist()
+    scene = {
+        "gravity": arrays["gravity"].tolist(),
+        "gravity_enabled": bool(arrays["gravity_enabled"]),
+        "anchors": [
+            {
+                "pos": pos,
+                "vel": vel,
+                "mass": mass,
+                "static": static,
+            }
+            for pos, vel, mass, static in zip(
+                arrays["anchor_pos"].tolist(),
+                arrays["anchor_vel"].tolist(),
+                arrays["anchor_mass"].tolist(),
+                arrays["anchor_static"].tolist(),
+            )
+        ],
+        "springs": [
+            {
+                "type": names[type_index],
+                "stiffness": stiffness,
+                "rest_length": rest_length,
+                "damping": damping,
+                # no limit is stored as null
+                "max_force": None if max_force == np.inf else max_force,
+                "min_force": None if min_force == -np.inf else min_force,
+                "start": start,
+                "end": end,
+            }
+            for type_index, stiffness, rest_length, damping, max_force, min_force, start, end in zip(
+                arrays["spring_type"].tolist(),
+                arrays["spring_stiffness"].tolist(),
+                arrays["spring_rest_length"].tolist(),
+                arrays["spring_damping"].tolist(),
+                arrays["spring_max_force"].tolist(),
+                arrays["spring_min_force"].tolist(),
+                arrays["spring_start"].tolist(),
+                arrays["spring_end"].tolist(),
+            )
+        ],
+    }
+    if camera is not None:
+        scene["camera"] = {"pos": arrays["camera_pos"].tolist(), "zoom": float(arrays["camera_zoom"])}
+    return scene
+
+# Replaces the scene of the simulation with the given one
+def from_dict(sim: Simulation, scene: dict, camera: Optional[Camera] = None):
+    anchors = scene.get("anchors", [])
+    springs = scene.get("springs", [])
+    names = sorted({data["type"] for data in springs})
+    arrays = {
+        "gravity": np.array(scene.get("gravity", sim.gravity), dtype=np.float64),
+        "gravity_enabled": np.array(scene.get("gravity_enabled", sim.gravity_enabled)),
+        "anchor_pos": np.array([data["pos"] for data in anchors], dtype=np.float64).reshape(-1, 2),
+        "anchor_vel": np.array([data.get("vel", (0, 0)) for data in anchors], dtype=np.float64).reshape(-1, 2),
+        "anchor_mass": np.array([data.get("mass", 1) for data in anchors], dtype=np.float64),
+        "anchor_static": np.array([data.get("static", False) for data in anchors], dtype=np.bool_),
+        "spring_types": np.array(names, dtype=str),
+        "spring_type": np.array([names.index(data["type"]) for data in springs], dtype=np.intp),
+        "spring_start": np.array([data["start"] for data in springs], dtype=np.intp),
+        "spring_end": np.array([data["end"] for data in springs], dtype=np.intp),
+        "spring_stiffness": np.array([data.get("stiffness", 10) for data in springs], dtype=np.float64),
+        "spring_rest_length": np.array([data.get("rest_length", 0) for data in springs], dtype=np.float64),
+        "spring_damping": np.array([data.get("damping", 0) for data in springs], dtype=np.float64),
+        "spring_max_force": np.array([
+            np.inf if data.get("max_force") is None else data["max_force"] for data in springs], dtype=np.float64),
+        "spring_min_force": np.array([
+            -np.inf if data.get("min_force") is None else data["min_force"] for data in springs], dtype=np.float64),
+    }
+    if "camera" in scene:
+        arrays["camera_pos"] = np.array(scene["camera"]["pos"], dtype=np.float64)
+        arrays["camera_zoom"] = np.array(scene["camera"]["zoom"], dtype=np.float64)
+    from_arrays(sim, arrays, camera)
+
+# Saves the scene as json, or as binary columns if the path ends with .npz
+def save(sim: Simulation, path: str, camera: Optional[Camera] = None):
+    if path.endswith(".npz"):
+        np.savez(path, **to_arrays(sim, camera))
+        return
+    with open(path, "w") as f:
+        json.dump(to_dict(sim, camera), f, indent=2)
+
+# Only the gravity and camera settings of a saved scene
+def read_settings(path: str) -> dict:
+    keys = ["gravity", "gravity_enabled", "camera_pos", "camera_zoom"]
+    if path.endswith(".npz"):
+        with np.load(path) as arrays:
+            return {key: arrays[key].tolist() for key in keys if key in arrays}
+    with open(path) as f:
+        data = json.load(f)
+    settings = {key: data[key] for key in keys[:2] if key in data}
+    if "camera" in data:
+        settings["camera_pos"] = data["camera"]["pos"]
+        settings["camera_zoom"] = data["camera"]["zoom"]
+    return settings
+
+# Number of anchors and springs of a saved scene
+def read_sizes(path: str) -> Tuple[int, int]:
+    if path.endswith(".npz"):
+        with np.load(path) as arrays:
+            return len(arrays["anchor_pos"]), len(arrays["spring_start"])
+    with open(path) as f:
+        data = json.load(f)
+    return len(data.get("anchors", [])), len(data.get("springs", []))
+
+def load(sim: Simulation, path: str, camera: Optional[Camera] = None):
+    if path.endswith(".npz"):
+        with np.load(path) as arrays:
+            from_arrays(sim, arrays, camera)
+        return
+    with open(path) as f:
+        from_dict(sim, json.load(f), camera)
@@ -0,0 +1,72 @@
+from typing import Callable, Optional
+import time
+
+# Runs a fixed timestep function in step with the real time.
+# Real time accumulates and gets consumed in steps of dt, running multiple
+# steps per tick if stepping is slower than the real time.
+class Scheduler:
+    step: Callable[[], None]
+    dt: float
+    # simulated seconds per real second
+    speed: float
+    # maximum number of steps per tick, the rest of the backlog is dropped
+    max_steps: int
+    # simulated time not yet stepped
+    accumulator: float
+    # whether the last tick had to drop time
+    behind: bool
+    # simulated seconds dropped since the start
+    dropped: float
+    # real time of the last tick which had to drop time, None if none had to
+    dropped_at: Optional[float]
+    # called with the dropped simulated seconds when falling behind
+    on_behind: Optional[Callable[[float], None]]
+
+    def __init__(self, step: Callable[[], None], dt: float, speed: float = 1, max_steps: int = 250):
+        self.step = step
+        self.dt = dt
+        self.speed = speed
+        self.max_steps = max_steps
+        self.behind = False
+        self.dropped = 0
+        self.dropped_at = None
+        self.on_behind = None
+        self.reset()
+
+    # Forgets the time passed so far, e.g. after a pause
+    def reset(self):
+        self.last = time.perf_counter()
+        self.accumulator = 0
+
+    # Runs the steps due since the last tick and returns how many were run
+    def tick(self) -> int:
+        now = time.perf_counter()
+        self.accumulator += (now - self.last) * self.speed
+        self.last = now
+
+        steps = int(self.accumulator / self.dt)
+        self.behind = steps > self.max_steps
+        if self.behind:
+            dropped = (steps - self.max_steps) * self.dt
+            self.dropped += dropped
+            self.dropped_at = now
+            self.accumulator -= dropped
+            steps = self.max_steps
+            if self.on_behind is not None:
+                self.on_behind(dropped)
+
+        for _ in range(steps):
+            self.step()
+        self.accumulator -= steps * self.dt
+        return steps
+
+    # Whether a tick had to drop time within the last given real seconds, which unlike
+    # behind doesn't flicker between ticks that still catch up and ones that don't
+    def fell_behind(self, within: float = 1) -> bool:
+        return self.dropped_at is not None and time.perf_counter() - self.dropped_at < within
+
+    # real seconds until the next step is due
+    def remaining(self) -> float:
+        if self.speed <= 0:
+            return self.dt
+        return max(0, (self.dt - self.accumulator) / self.speed - (time.perf_counter() - self.last))
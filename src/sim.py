@@ -1,15 +1,30 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Type
 from abc import ABC, abstractmethod
 from render import Render
+from engine import Engine, Table, LAWS, LAW_CUSTOM, SIZE_RATIO, register_law
+from scheduler import Scheduler
+from integrators import Integrator, Euler, INTEGRATORS
+from snapshot import Snapshot
+from recorder import Recorder
+from islands import Islands, SLEEP_SPEED, SLEEP_STEPS
+from checkpoints import Checkpoint, Checkpoints
+from draw import anchor_color, spring_color, draw_spring
 import pygame
 import threading
 import time
+import copy
 import math
+import numpy as np
 
 # describes how fine the simulation runs
 TIMESTEP = 0.01
 # describes at which speed the simulation runs compared to the real time
+# (simulated seconds per real second)
 SIM_TO_REAL = 1
+# default share of the approach speed colliding anchors keep
+RESTITUTION = 0.5
+# longest a fast forward holds the lock in one go in seconds, so edits get through in between
+FORWARD_CHUNK = 0.05
 
 class Force:
     def __init__(self, vec):
@@ -20,9 +35,139 @@ class Force:
         vec = pygame.Vector2(vec)
         return Force(vec), Force(-vec)
 
+# An attribute of an entity, which lives in a column of the engine
+# once the entity is part of a simulation and on the entity itself before
+class Field:
+    def __init__(self, column: str, vector=False, none=None):
+        self.column = column
+        self.vector = vector
+        # value stored in the column in place of None
+        self.none = none
+
+    def __set_name__(self, owner, name):
+        self.local = "_local" + name
+
+    def __get__(self, entity, owner=None):
+        if entity is None:
+            return self
+        if entity._table is None:
+            if self.local not in entity.__dict__:
+                raise AttributeError(self.local[len("_local"):])
+            value = entity.__dict__[self.local]
+            return pygame.Vector2(value) if self.vector else value
+
+        value = getattr(entity._table, self.column)[entity._index]
+        if self.vector:
+            return pygame.Vector2(value.tolist())
+        value = value.item()
+        if self.none is not None and value == self.none:
+            return None
+        return value
+
+    # Writes into the row under the lock of the engine, so the row doesn't move
+    # in between, e.g. when the simulation thread removes other rows meanwhile
+    def __set__(self, entity, value):
+        engine = entity._engine
+        if engine is None:
+            self.set_local(entity, value)
+            return
+        with engine.lock:
+            # it might have been removed while waiting for the lock
+            if entity._table is None:
+                self.set_local(entity, value)
+            else:
+                self.set_row(entity, value)
+
+    def set_local(self, entity, value):
+        entity.__dict__[self.local] = pygame.Vector2(value) if self.vector else value
+
+    def set_row(self, entity, value):
+        if value is None:
+            value = self.none
+        getattr(entity._table, self.column)[entity._index] = value
+        entity._engine.edited(entity._table, entity._index, self.column)
+
+# A field referencing an anchor, stored as the anchor's index in the engine
+class AnchorField(Field):
+    def __get__(self, entity, owner=None):
+        if entity is None:
+            return self
+        if entity._table is None:
+            return entity.__dict__[self.local]
+
+        return entity._engine.anchors.view(getattr(entity._table, self.column)[entity._index])
+
+    def set_local(self, entity, anchor: 'Anchor'):
+        entity.__dict__[self.local] = anchor
+
+    def set_row(self, entity, anchor: 'Anchor'):
+        assert anchor._table is entity._engine.anchors
+        getattr(entity._table, self.column)[entity._index] = anchor._index
+        entity._engine.edited(entity._table, entity._index, self.column)
+
+# An object whose fields are views onto a row of the simulation engine
+class Entity:
+    _engine: Engine
+    _table: Table
+    _index: int
+
+    _engine = None
+    _table = None
+    _index = None
+
+    # Names of the fields, worked out once per class as they get looked up
+    # for every entity bound or unbound
+    @classmethod
+    def fields(cls) -> List[str]:
+        fields = cls.__dict__.get("_fields")
+        if fields is None:
+            fields = [name for klass in reversed(cls.__mro__)
+                      for name, attr in vars(klass).items() if isinstance(attr, Field)]
+            cls._fields = fields
+        return fields
+
+    # unique id within the simulation, None if not part of one
+    @property
+    def uid(self):
+        return None if self._table is None else int(self._table.uid[self._index])
+
+    # Creates an entity viewing an existing row of the given table
+    @classmethod
+    def attach(cls, engine: Engine, table: Table, index: int) -> 'Entity':
+        entity = cls.__new__(cls)
+        entity._engine = engine
+        entity._table = table
+        entity._index = index
+        return entity
+
+    # Moves the fields of this entity into a new row of the given table
+    def bind(self, engine: Engine, table: Table, uid=None):
+        values = {name: getattr(self, name) for name in self.fields() if hasattr(self, name)}
+        self._engine = engine
+        self._table = table
+        self._index = table.add(self, uid)
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    # Moves the fields of this entity back onto the entity
+    def unbind(self):
+        values = {name: getattr(self, name) for name in self.fields()}
+        self._engine = None
+        self._table = None
+        self._index = None
+        for name, value in values.items():
+            setattr(self, name, value)
+
 # An anchor is a point on which force can be applied to for moving the point
-class Anchor:
-    selected: bool
+class Anchor(Entity):
+    pos = Field("pos", vector=True)
+    vel = Field("vel", vector=True)
+    coef = Field("coef")
+    radius = Field("radius")
+    selected = Field("selected")
+    _mass = Field("mass")
+    _static = Field("static")
+    _lock = Field("locked")
 
     def __init__(self, pos=(0,0), vel=(0,0), static=False, lock=False, mass=1):
         self.pos = pygame.Vector2(pos)
@@ -39,18 +184,17 @@ class Anchor:
         self.coef = 0 if self._static or self._lock else 1 / self._mass
 
     def update_radius(self):
-        SIZE_RATIO = 0.10876
         self.radius = math.sqrt(self._mass) * SIZE_RATIO
     
     # Apply a force to this anchor
     # F = m * a
-    def apply(self, force: Force):
-        self.vel += TIMESTEP * self.coef * force.vec
+    def apply(self, force: Force, dt: float = TIMESTEP):
+        self.vel += dt * self.coef * force.vec
     
     # Update the position of this anchor
-    def update(self):
+    def update(self, dt: float = TIMESTEP):
         if not self._lock:
-            self.pos += TIMESTEP * self.vel
+            self.pos += dt * self.vel
 
     def set_mass(self, val: float):
         self._mass = val
@@ -88,23 +232,46 @@ class Anchor:
         return self.get_rect(render).collidepoint(point)
 
     def render(self, render: Render):
-        if self.selected:
-            color = (0, 255, 100)
-        elif self._static:
-            color = (150, 150, 150)
-        else:
-            color = (255, 255, 255)
-
-        render.draw_circle(color, self.pos, self.radius)
-
-class Spring(ABC):
-    start: Anchor
-    end: Anchor
-    selected: bool
+        render.draw_circle(anchor_color(self.selected, self._static), self.pos, self.radius)
+
+class Spring(Entity, ABC):
+    start = AnchorField("start")
+    end = AnchorField("end")
+    stiffness = Field("stiffness")
+    # distance between the anchors at which the spring applies no force
+    rest_length = Field("rest_length")
+    # force per speed at which the anchors move apart, taking energy out of oscillations
+    damping = Field("damping")
+    max_force = Field("max_force", none=np.inf)
+    min_force = Field("min_force", none=-np.inf)
+    selected = Field("selected")
+    # name of the vectorized force kernel in the engine, None if there is none
+    law = None
+    # vectorized magnitude(dist, stiffness) over arrays of a subclass, which gets
+    # registered as its law so its springs are evaluated in one call per step
+    kernel = None
+    # whether the magnitude is measured from the rest length, else from the distance
+    # between the anchors, in which case the spring has no rest length
+    stretched = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "kernel" in vars(cls):
+            cls.law = cls.law if "law" in vars(cls) else cls.__name__
+            register_law(cls.law, cls.kernel, cls.stretched)
+            if "magnitude" not in vars(cls):
+                cls.magnitude = Spring.kernel_magnitude
+        elif "magnitude" in vars(cls) and "law" not in vars(cls):
+            # overriding the magnitude of a spring with a law needs the scalar path
+            cls.law = None
 
     def __init__(self, **kwargs):
         self.start = kwargs.get("start", Anchor((0, 0)))
-        self.end = kwargs.get("end", Anchor(self.start.pos))
+        self.end = kwargs["end"] if "end" in kwargs else Anchor(self.start.pos)
+        self.rest_length = kwargs.get("rest_length", 0)
+        if self.rest_length and not self.stretched:
+            raise ValueError(f"{type(self).__name__} has no rest length")
+        self.damping = kwargs.get("damping", 0)
         self.max_force = kwargs.get("max_force")
         self.min_force = kwargs.get("min_force")
         self.selected = False
@@ -112,57 +279,40 @@ class Spring(ABC):
         assert isinstance(self.start, Anchor)
         assert isinstance(self.end, Anchor)
 
-    # returns the magnitude of the force this spring applies based on the compression
+    # returns the magnitude of the force this spring applies based on how far it is
+    # stretched beyond its rest length, negative when compressed, or on the distance
+    # between its anchors if it isn't stretched. Springs with a kernel get it from there.
     @abstractmethod
     def magnitude(self, dist: float) -> float:
         pass
 
+    # magnitude of a spring with a kernel, the kernel evaluated for it alone
+    def kernel_magnitude(self, dist: float) -> float:
+        return float(self.kernel(np.array([dist]), np.array([self.stiffness]))[0])
+
     def force(self) -> Tuple[Force, Force]:
         delta = self.end.pos - self.start.pos
         dist = delta.magnitude()
         if dist == 0:
             return Force.pair((0, 0))
-        magnitude = self.magnitude(dist)
+        magnitude = self.magnitude(dist - self.rest_length if self.stretched else dist)
         if self.max_force is not None:
             magnitude = min(self.max_force, magnitude)
         if self.min_force is not None:
             magnitude = max(self.min_force, magnitude)
+        if not math.isfinite(magnitude):
+            magnitude = 0
+        if self.damping:
+            magnitude += self.damping * (self.end.vel - self.start.vel).dot(delta) / dist
         return Force.pair(delta * (magnitude / dist))
 
-    def apply(self):
+    def apply(self, dt: float = TIMESTEP):
         start_force, end_force = self.force()
-        self.start.apply(start_force)
-        self.end.apply(end_force)
+        self.start.apply(start_force, dt)
+        self.end.apply(end_force, dt)
     
     def render(self, render: Render):
-        SPRING_WIDTH = 0.2
-        SEGS = 20
-        delta = self.end.pos - self.start.pos
-        dist = delta.magnitude()
-        if dist == 0:
-            return
-        delta_n = delta / dist
-        normal = pygame.Vector2(-delta_n.y, delta_n.x)
-
-        points = []
-        points.append(self.start.pos)
-
-        # 10 zigzag segments
-        for i in range(1, SEGS):
-            off_delta = (i / SEGS) * delta
-            off_normal = SPRING_WIDTH * (normal if i % 2 == 0 else -normal)
-            points.append(self.start.pos + off_delta + off_normal)
-
-        points.append(self.end.pos)
-        
-        if self.selected:
-            color = (0, 255, 100)
-        elif self.stiffness < 0:
-            color = (232, 38, 4)
-        else:
-            color = (237, 248, 100)
-
-        render.draw_lines(color, False, points, width=0.05)
+        draw_spring(render, spring_color(self.selected, self.stiffness), self.start.pos, self.end.pos)
     
     def get_rect(self, render: Render):
         center = render.transform_point(0.5 * (self.start.pos + self.end.pos))
@@ -176,6 +326,8 @@ class Spring(ABC):
 
 # A spring whose foce applied when compressed is proportional to the compressed distance
 class HookesSpring(Spring):
+    law = "hooke"
+
     def __init__(self, stiffness: float = 10, **kwargs):
         super().__init__(**kwargs)
         self.stiffness = stiffness
@@ -185,24 +337,31 @@ class HookesSpring(Spring):
 
 # A spring whose foce applied when compressed is quadratic to the compressed distance
 class QuadraticSpring(Spring):
+    law = "quadratic"
+
     def __init__(self, stiffness: float = 10, **kwargs):
         super().__init__(**kwargs)
         self.stiffness = stiffness
 
     def magnitude(self, dist: float) -> float:
-        return dist ** 2 * self.stiffness
+        return abs(dist) * dist * self.stiffness
 
 # A spring whose foce applied when compressed is constant
 class ConstantSpring(Spring):
+    law = "constant"
+
     def __init__(self, stiffness: float = 10, **kwargs):
         super().__init__(**kwargs)
         self.stiffness = stiffness
 
-    def magnitude(self, _: float) -> float:
-        return self.stiffness
+    def magnitude(self, dist: float) -> float:
+        return math.copysign(self.stiffness, dist) if dist else 0.0
 
 # A spring whose foce applied when compressed is antiproportional to the compressed amount (with a maximum)
 class HyperbolicSpring(Spring):
+    law = "hyperbolic"
+    stretched = False
+
     def __init__(self, stiffness: float = 10, **kwargs):
         super().__init__(**kwargs)
         self.stiffness = stiffness
@@ -210,33 +369,105 @@ class HyperbolicSpring(Spring):
     def magnitude(self, dist: float) -> float:
         return self.stiffness / dist
 
+# Id of the vectorized law of a spring class, LAW_CUSTOM if it has none
+def law_id(cls: Type[Spring]) -> int:
+    return LAWS.index(cls.law) if cls.law in LAWS else LAW_CUSTOM
+
+# The spring class implementing the vectorized law with the given id
+def law_class(law: int) -> Type[Spring]:
+    classes = [Spring]
+    while classes:
+        cls = classes.pop(0)
+        if cls.law is not None and law_id(cls) == law:
+            return cls
+        classes.extend(cls.__subclasses__())
+    raise ValueError(f"no spring class for law {law}")
+
 class Simulation(threading.Thread):
     root_anchor: Anchor
     gravity: pygame.Vector2
     gravity_enabled: bool
-    anchors: List[Anchor]
-    springs: List[Spring]
-
-    def __init__(self,  *args, **kwargs):
+    engine: Engine
+    # whether to step the engine with its batched kernels instead of per object
+    vectorized: bool
+    # keeps the simulation in step with the real time while running
+    scheduler: Scheduler
+    # simulated seconds per step
+    timestep: float
+    # how the engine gets advanced by a step
+    integrator: Integrator
+    # number of steps simulated so far
+    step_count: int
+    # whether anchors bounce off each other instead of passing through
+    collisions: bool
+    # share of the approach speed anchors keep when bouncing off each other
+    restitution: float
+    # whether islands which came to rest are left out of the steps until something wakes them
+    sleeping: bool
+    islands: Islands
+    # checkpoints taken every few steps to restore or rewind to
+    checkpoints: Checkpoints
+    # latest published state for drawing, replaced as a whole on publish
+    snapshot: Snapshot
+
+    def __init__(self, *args, vectorized=True, **kwargs):
         super(Simulation, self).__init__(*args, **kwargs)
         self._stop_event = threading.Event()
         self._pause_event = threading.Event()
-
+        self.engine = Engine()
+        # guards the engine against concurrent stepping and editing,
+        # the entities take it when they get set
+        self.lock = self.engine.lock
+        # views of rows added in bulk are created when first needed
+        self.engine.anchors.factory = lambda index: Anchor.attach(self.engine, self.engine.anchors, index)
+        self.engine.springs.factory = lambda index: law_class(self.engine.springs.law[index]).attach(
+            self.engine, self.engine.springs, index)
+        self.vectorized = vectorized
+        self.timestep = TIMESTEP
+        self.integrator = Euler()
+        self.scheduler = Scheduler(self.update, self.timestep, SIM_TO_REAL)
         self.gravity_enabled = True
         self.gravity = pygame.Vector2(0, -9.81)
+        self.collisions = False
+        self.restitution = RESTITUTION
+        self.sleeping = True
+        self.islands = Islands()
+        self.engine.on_edit = self.edited
+        self.checkpoints = Checkpoints()
+        # (simulated seconds, until_rest) to fast forward by on the simulation thread, see fast_forward
+        self.forward = None
         self.root_anchor = Anchor((0, 0), static=True)
-        self.anchors = [
+        anchors = [
             self.root_anchor,
             Anchor((0, -1), vel=(2, 0)),
             # Anchor((1, 0))
         ]
-        self.springs = [
-            HyperbolicSpring(stiffness=200, max_force=100, start=self.anchors[0], end=self.anchors[1]),
-            # QuadraticSpring(stiffness=2, start=self.anchors[1], end=self.anchors[2]),
-            # QuadraticSpring(stiffness=2, start=self.anchors[0], end=self.anchors[2]),
+        springs = [
+            HyperbolicSpring(stiffness=200, max_force=100, start=anchors[0], end=anchors[1]),
+            # QuadraticSpring(stiffness=2, start=anchors[1], end=anchors[2]),
+            # QuadraticSpring(stiffness=2, start=anchors[0], end=anchors[2]),
         ]
-        self.entities = self.anchors + self.springs
-        self.records = []
+        for entity in anchors + springs:
+            self.add(entity)
+        # records the anchors while simulating, None if not recording
+        self.recorder = None
+        # timings of the passes of a step, shared with the engine
+        self.profiler = self.engine.profiler
+        self.step_count = 0
+        self.publish()
+
+    # copies, the lists of the engine map its rows to their objects
+    @property
+    def anchors(self) -> List[Anchor]:
+        return list(self.engine.anchors.all_views())
+
+    @property
+    def springs(self) -> List[Spring]:
+        return list(self.engine.springs.all_views())
+
+    @property
+    def entities(self) -> list:
+        return self.anchors + self.springs
     
     def toggle(self):
         if self._pause_event.is_set():
@@ -256,49 +487,470 @@ class Simulation(threading.Thread):
     def stopped(self):
         return self._stop_event.is_set()
 
+    def paused(self):
+        return self._pause_event.is_set()
+
     def run(self):
+        self.scheduler.reset()
         while not self._stop_event.is_set():
-            if not self._pause_event.is_set():
-                self.update()
-            time.sleep(SIM_TO_REAL * TIMESTEP)
+            if self.forward is not None:
+                (seconds, until_rest), self.forward = self.forward, None
+                self.fast_forward(seconds, until_rest)
+                continue
+            if self._pause_event.is_set():
+                self.scheduler.reset()
+                # keep edits made while paused visible
+                self.publish()
+                time.sleep(TIMESTEP)
+                continue
+            if self.scheduler.tick() > 0:
+                self.publish()
+            time.sleep(self.scheduler.remaining())
+        self.stop_recording()
+
+    # Starts recording the anchors with the given uids (default: all current ones)
+    # every n-th step, into the file at path or only into memory, see Recorder
+    def record(self, path: Optional[str] = None, uids=None, every: int = 1, capacity: int = 4096) -> Recorder:
+        with self.lock:
+            self.stop_recording()
+            if uids is None:
+                uids = self.engine.anchors.uid[:self.engine.anchors.size]
+            self.recorder = Recorder(uids, every, capacity, path)
+            return self.recorder
+
+    def stop_recording(self):
+        with self.lock:
+            if self.recorder is not None:
+                self.recorder.close()
+                self.recorder = None
+
+    # Timings of the passes of a step in milliseconds (see Profiler.stats),
+    # the steps per second achieved and targeted and the size of the scene
+    def profile(self) -> dict:
+        return {
+            "phases": self.profiler.stats(),
+            "steps_per_second": 0.0 if self.paused() else self.profiler.rate("update"),
+            "target_steps_per_second": self.get_speed() / self.timestep,
+            "anchors": self.engine.anchors.size,
+            "springs": self.engine.springs.size,
+            "asleep": self.islands.sleeping,
+            "behind": self.scheduler.fell_behind(),
+            "dropped_seconds": self.scheduler.dropped,
+        }
+
+    # Whether the simulation fell behind the real time within the last second and had
+    # to drop simulated time, and the simulated seconds dropped so far
+    def lag(self) -> Tuple[bool, float]:
+        return self.scheduler.fell_behind(), self.scheduler.dropped
+
+    # Publishes a snapshot of the current state for drawing
+    def publish(self):
+        with self.lock:
+            snapshot = Snapshot.of(self.engine, self.step_count)
+        self.snapshot = snapshot
+
+    # simulated seconds per real second
+    def get_speed(self) -> float:
+        return self.scheduler.speed
+
+    def set_speed(self, val: float):
+        self.scheduler.speed = val
+
+    def set_gravity(self, val):
+        self.gravity = pygame.Vector2(val)
+        self.islands.wake_all()
+        self.integrator.reset()
+
+    def set_gravity_enabled(self, val: bool):
+        self.gravity_enabled = val
+        self.islands.wake_all()
+        self.integrator.reset()
+
+    def set_collisions(self, val: bool):
+        self.collisions = val
+        self.islands.wake_all()
+
+    def set_restitution(self, val: float):
+        self.restitution = val
+        self.islands.wake_all()
+
+    def set_sleeping(self, val: bool):
+        self.sleeping = val
+        self.islands.wake_all()
+        self.integrator.reset()
+
+    # Wakes the islands an edited entity belongs to and drops what the integrator
+    # carried over, e.g. the acceleration verlet reuses, which no longer holds
+    def edited(self, table, index: int, column: str):
+        if column == "selected":
+            return
+        self.integrator.reset()
+        if column in ("static", "start", "end"):
+            # the springs between islands changed
+            self.islands.dirty = True
+        if table is self.engine.anchors:
+            self.islands.wake(self.engine, index)
+        else:
+            self.islands.wake(self.engine, [table.start[index], table.end[index]])
+
+    def set_timestep(self, val: float):
+        self.timestep = val
+        self.scheduler.dt = val
+        self.integrator.reset()
+
+    # Selects the integrator by name (see integrators.INTEGRATORS) or instance
+    def set_integrator(self, integrator):
+        if isinstance(integrator, str):
+            integrator = INTEGRATORS[integrator]()
+        self.integrator = integrator
 
     def unselect(self):
-        for entity in self.entities:
-            entity.selected = False
+        self.engine.anchors.selected[:] = False
+        self.engine.springs.selected[:] = False
+
+    # Selects the anchors and springs with the given uids
+    def select(self, anchors, springs):
+        for table, uids in [(self.engine.anchors, anchors), (self.engine.springs, springs)]:
+            table.selected[:table.size] |= np.isin(table.uid[:table.size], uids)
+
+    def get_anchor(self, uid: int) -> Optional[Anchor]:
+        row = self.engine.anchors.find(uid)
+        return None if row is None else self.engine.anchors.view(row)
+
+    def get_spring(self, uid: int) -> Optional[Spring]:
+        row = self.engine.springs.find(uid)
+        return None if row is None else self.engine.springs.view(row)
+
+    # The anchors and springs with the given uids in row order, leaving out the ones which
+    # are gone, e.g. the selected ones of a snapshot. Only their views get created.
+    def get_entities(self, anchor_uids, spring_uids) -> list:
+        entities = []
+        with self.lock:
+            for table, uids in [(self.engine.anchors, anchor_uids), (self.engine.springs, spring_uids)]:
+                if len(uids) == 0:
+                    continue
+                rows = np.flatnonzero(np.isin(table.uid[:table.size], uids))
+                entities += [table.view(row) for row in rows.tolist()]
+        return entities
+
+    def add_anchor(self, anchor: Anchor, uid=None) -> Anchor:
+        with self.lock:
+            anchor.bind(self.engine, self.engine.anchors, uid)
+            self.integrator.reset()
+        return anchor
+
+    def add_spring(self, spring: Spring, uid=None) -> Spring:
+        with self.lock:
+            for anchor in (spring.start, spring.end):
+                if anchor._engine is None:
+                    self.add_anchor(anchor)
+            spring.bind(self.engine, self.engine.springs, uid)
+            self.engine.springs.law[spring._index] = law_id(type(spring))
+            self.integrator.reset()
+        return spring
+
+    # Adds anchors in bulk straight into the engine, their objects are only created
+    # once needed. The values are single ones or one per anchor. Returns their rows.
+    def add_anchors(self, pos, vel=(0, 0), mass=1, static=False) -> np.ndarray:
+        with self.lock:
+            pos = np.asarray(pos, dtype=np.float64).reshape(-1, 2)
+            n = len(pos)
+            first = self.engine.add_anchors(
+                pos,
+                np.broadcast_to(np.asarray(vel, dtype=np.float64), (n, 2)),
+                np.broadcast_to(np.asarray(mass, dtype=np.float64), (n,)),
+                np.broadcast_to(np.asarray(static, dtype=np.bool_), (n,)),
+            )
+            self.integrator.reset()
+        return np.arange(first, first + n)
+
+    # Adds springs in bulk between the anchors at the given rows, of the given class
+    # or of a list of classes taking turns. The values are single ones or one per
+    # spring, no rest length makes them rest at the length they are added with,
+    # springs which aren't stretched get none. Returns their rows.
+    def add_springs(self, cls, start, end, stiffness=10, rest_length=None, damping=0,
+                    max_force=None, min_force=None) -> np.ndarray:
+        classes = list(cls) if isinstance(cls, (list, tuple)) else [cls]
+        with self.lock:
+            engine = self.engine
+            start = np.asarray(start, dtype=np.intp)
+            end = np.asarray(end, dtype=np.intp)
+            m = len(start)
+            laws = np.array([law_id(spring) for spring in classes], dtype=np.int8)
+            types = np.arange(m) % len(classes)
+            stretched = np.array([spring.stretched for spring in classes])[types]
+            if rest_length is None:
+                delta = engine.anchors.pos[end] - engine.anchors.pos[start]
+                rest_length = np.where(stretched, np.hypot(delta[:, 0], delta[:, 1]), 0)
+            elif np.any(np.broadcast_to(rest_length, (m,))[~stretched]):
+                names = sorted({spring.__name__ for spring in classes if not spring.stretched})
+                raise ValueError(f"{', '.join(names)} has no rest length")
+            first = engine.add_springs(
+                start,
+                end,
+                laws[types],
+                stiffness,
+                np.inf if max_force is None else max_force,
+                -np.inf if min_force is None else min_force,
+                rest_length,
+                damping,
+            )
+            # springs which aren't of the class of their law need their view right away
+            for i, spring in enumerate(classes):
+                if laws[i] != LAW_CUSTOM and law_class(laws[i]) is spring:
+                    continue
+                for index in (first + np.flatnonzero(types == i)).tolist():
+                    engine.springs.views[index] = spring.attach(engine, engine.springs, index)
+            self.integrator.reset()
+        return np.arange(first, first + m)
+
+    def add(self, entity):
+        if isinstance(entity, Anchor):
+            return self.add_anchor(entity)
+        elif isinstance(entity, Spring):
+            return self.add_spring(entity)
 
     def remove_anchor(self, anchor: Anchor):
-        for spring in self.springs[:]:
-            if spring.start == anchor or spring.end == anchor and spring in self.springs:
-                self.springs.remove(spring)
-                self.entities.remove(spring)
-
-        self.anchors.remove(anchor)
-        self.entities.remove(anchor)
+        self.remove_anchors([anchor._index])
 
     def remove_spring(self, spring: Spring):
-        self.springs.remove(spring)
-        self.entities.remove(spring)
+        self.remove_springs([spring._index])
 
     def remove(self, entity):
-        if isinstance(entity, Anchor):
-            self.remove_anchor(entity)
-        elif isinstance(entity, Spring):
-            self.remove_spring(entity)
+        self.remove_many([entity])
+
+    # Removes the anchors at the given rows in bulk, along with the springs attached to them
+    def remove_anchors(self, rows):
+        rows = np.unique(np.asarray(rows, dtype=np.intp))
+        if len(rows) == 0:
+            return
+        with self.lock:
+            engine = self.engine
+            springs = engine.attached(rows)
+            self.detach_springs(springs)
+            for index in rows.tolist():
+                anchor = engine.anchors.views[index]
+                if anchor is not None:
+                    anchor.unbind()
+            engine.remove_anchors(rows, springs)
+            self.integrator.reset()
+
+    # Removes the springs at the given rows in bulk
+    def remove_springs(self, rows):
+        rows = np.unique(np.asarray(rows, dtype=np.intp))
+        if len(rows) == 0:
+            return
+        with self.lock:
+            self.detach_springs(rows)
+            self.engine.remove_springs(rows)
+            self.integrator.reset()
+
+    # Gets the springs at the given rows ready to be removed: wakes the anchors
+    # they held, which lose a force, and moves the fields of their objects back
+    def detach_springs(self, rows: np.ndarray):
+        engine = self.engine
+        if len(rows) == 0:
+            return
+        self.islands.wake(engine, np.concatenate([engine.springs.start[rows], engine.springs.end[rows]]))
+        for index in rows.tolist():
+            spring = engine.springs.views[index]
+            if spring is not None:
+                spring.unbind()
+
+    # Removes many anchors and springs at once, e.g. all selected ones
+    def remove_many(self, entities):
+        with self.lock:
+            entities = [entity for entity in entities if entity._engine is self.engine]
+            springs = [entity._index for entity in entities if isinstance(entity, Spring)]
+            anchors = [entity._index for entity in entities if isinstance(entity, Anchor)]
+            # removing springs doesn't move anchor rows
+            self.remove_springs(springs)
+            self.remove_anchors(anchors)
+
+    # Removes all anchors and springs
+    def clear(self):
+        with self.lock:
+            # only the objects which exist, the springs first as their ends get looked up
+            for table in (self.engine.springs, self.engine.anchors):
+                for entity in table.views:
+                    if entity is not None:
+                        entity.unbind()
+            self.engine.springs.clear()
+            self.engine.anchors.clear()
+            self.integrator.reset()
+            # they would bring back the old scene
+            self.checkpoints.clear()
+
+    # Takes a checkpoint of the current state and keeps it in the ring of checkpoints
+    def checkpoint(self) -> Checkpoint:
+        with self.lock:
+            checkpoint = Checkpoint(
+                self.step_count,
+                self.engine.anchors.state(),
+                self.engine.springs.state(),
+                {
+                    "gravity": tuple(self.gravity),
+                    "gravity_enabled": self.gravity_enabled,
+                    "timestep": self.timestep,
+                    "collisions": self.collisions,
+                    "restitution": self.restitution,
+                    "sleeping": self.sleeping,
+                    # springs whose class can't be told from their law
+                    "spring_classes": {int(self.engine.springs.uid[index]): type(view)
+                        for index, view in enumerate(self.engine.springs.views) if view is not None},
+                },
+                copy.deepcopy(self.integrator),
+                copy.deepcopy(self.islands),
+            )
+            self.checkpoints.add(checkpoint)
+            return checkpoint
+
+    # Puts the simulation back into the state of a checkpoint, simulating on from
+    # there gives the same steps as the first time. Anchors and springs which
+    # didn't exist back then get detached, the others keep their objects and
+    # what is selected stays selected. Later checkpoints get dropped.
+    def restore(self, checkpoint: Checkpoint):
+        with self.lock:
+            engine = self.engine
+            selected = {}
+            for table, state in [(engine.springs, checkpoint.springs), (engine.anchors, checkpoint.anchors)]:
+                uid = table.uid[:table.size]
+                selected[id(table)] = uid[table.selected[:table.size]]
+                for index in np.flatnonzero(~np.isin(uid, state[0]["uid"])).tolist():
+                    if table.views[index] is not None:
+                        table.views[index].unbind()
+            for table, state in [(engine.anchors, checkpoint.anchors), (engine.springs, checkpoint.springs)]:
+                table.load(state)
+                table.selected[:table.size] = np.isin(table.uid[:table.size], selected[id(table)])
+
+            settings = checkpoint.settings
+            classes = settings["spring_classes"]
+            springs = engine.springs
+            for index in np.flatnonzero(np.isin(springs.uid[:springs.size], list(classes))).tolist():
+                if springs.views[index] is None:
+                    springs.views[index] = classes[int(springs.uid[index])].attach(engine, springs, index)
+            self.gravity = pygame.Vector2(settings["gravity"])
+            self.gravity_enabled = settings["gravity_enabled"]
+            self.set_timestep(settings["timestep"])
+            self.collisions = settings["collisions"]
+            self.restitution = settings["restitution"]
+            self.sleeping = settings["sleeping"]
+            # copied again, so the checkpoint can be restored more than once
+            self.integrator = copy.deepcopy(checkpoint.integrator)
+            self.islands = copy.deepcopy(checkpoint.islands)
+            self.step_count = checkpoint.step
+            self.checkpoints.truncate(checkpoint.step)
+        self.publish()
+
+    # Goes back to the given step by restoring the newest checkpoint at or before it
+    # and simulating on to it. Returns whether there was such a checkpoint.
+    def seek(self, step: int) -> bool:
+        with self.lock:
+            checkpoint = self.checkpoints.before(step)
+            if checkpoint is None:
+                return False
+            self.restore(checkpoint)
+            while self.step_count < step:
+                self.update()
+        self.publish()
+        return True
+
+    # Simulates the given number of seconds as fast as possible, paused or not, and
+    # publishes the state at the end only. The steps are the same as when simulating
+    # in real time, but the kernels keep their lookups between steps and nothing gets
+    # drawn in between. With until_rest it stops early once all anchors which aren't
+    # locked stayed slower than SLEEP_SPEED for SLEEP_STEPS steps. Without wait, the
+    # simulation thread does it if it is running. Returns the number of steps simulated.
+    def fast_forward(self, seconds: float, until_rest: bool = False, wait: bool = True) -> int:
+        if not wait and self.is_alive():
+            self.forward = (seconds, until_rest)
+            return 0
+        steps = int(round(seconds / self.timestep))
+        done = 0
+        calm = 0
+        while done < steps:
+            with self.lock, self.engine.hold():
+                end = time.perf_counter() + FORWARD_CHUNK
+                while done < steps and time.perf_counter() < end:
+                    self.update()
+                    done += 1
+                    if until_rest:
+                        # held anchors keep the velocity they had when locked
+                        n = self.engine.anchors.size
+                        vel = self.engine.anchors.vel[:n][~self.engine.anchors.locked[:n]]
+                        resting = len(vel) == 0 or np.einsum("ij,ij->i", vel, vel).max() < SLEEP_SPEED ** 2
+                        calm = calm + 1 if resting else 0
+                        if calm >= SLEEP_STEPS:
+                            steps = done
+        # don't make up for the time it took
+        self.scheduler.reset()
+        self.publish()
+        return done
+
+    # Goes back to the newest checkpoint before the current step
+    def rewind(self) -> bool:
+        with self.lock:
+            checkpoint = self.checkpoints.before(self.step_count - 1)
+            if checkpoint is None:
+                return False
+            self.restore(checkpoint)
+        return True
 
     def update(self):
-        for anchor in self.anchors[:]:
-            if anchor.pos.magnitude_squared() > 2000:
-                self.remove_anchor(anchor)
-
-        # apply the forces from the springs
-        for spring in self.springs:
-            spring.apply()
-
-        if self.gravity_enabled:
-            # apply gravity
-            for anchor in self.anchors:
-                anchor.apply(Force(self.gravity * anchor._mass))
-        
-        # update positions
-        for anchor in self.anchors:
-            anchor.update()
+        profiler = self.profiler
+        with self.lock, profiler.measure("update"), self.engine.hold():
+            if self.checkpoints.due(self.step_count):
+                with profiler.measure("checkpoint"):
+                    self.checkpoint()
+
+            with profiler.measure("cull"):
+                rows = None
+                if self.sleeping and self.vectorized:
+                    # sleeping anchors don't move, so they can't leave the area
+                    self.islands.refresh(self.engine)
+                    rows = self.islands.awake_rows(self.engine)[0]
+                self.remove_anchors(self.engine.out_of_bounds(rows))
+            self.step_count += 1
+
+            if self.vectorized:
+                gravity = self.gravity if self.gravity_enabled else None
+                # the force and gravity passes of the integrator get timed by the engine
+                with profiler.measure("integrate"):
+                    if self.sleeping:
+                        self.islands.step(self.engine, self.integrator, self.timestep, gravity)
+                    else:
+                        self.integrator.step(self.engine, self.timestep, gravity)
+            else:
+                # apply the forces from the springs
+                with profiler.measure("forces"):
+                    for spring in self.springs:
+                        spring.apply(self.timestep)
+
+                if self.gravity_enabled:
+                    # apply gravity
+                    with profiler.measure("gravity"):
+                        for anchor in self.anchors:
+                            anchor.apply(Force(self.gravity * anchor._mass), self.timestep)
+
+                # update positions
+                with profiler.measure("integrate"):
+                    for anchor in self.anchors:
+                        anchor.update(self.timestep)
+
+            if self.collisions:
+                with profiler.measure("collide"):
+                    if self.sleeping and self.islands.sleeping:
+                        # sleeping anchors don't get pushed, but wake when something bumps into them
+                        asleep = self.islands.sleeping_mask()
+                        coef = np.where(asleep, 0, self.engine.anchors.coef[:len(asleep)])
+                        i, j = self.engine.collide(self.restitution, coef)
+                        bumped = asleep[i] | asleep[j]
+                        self.islands.wake(self.engine, np.concatenate([i[bumped], j[bumped]]))
+                    else:
+                        self.engine.collide(self.restitution)
+
+            if self.recorder is not None:
+                with profiler.measure("record"):
+                    anchors = self.engine.anchors
+                    n = anchors.size
+                    self.recorder.capture(anchors.uid[:n], anchors.pos[:n], anchors.vel[:n], self.step_count)
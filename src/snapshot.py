@@ -0,0 +1,78 @@
+from engine import Engine
+import numpy as np
+
+# snapshot attribute -> engine column
+ANCHOR_COLUMNS = {
+    "anchor_uid": "uid",
+    "pos": "pos",
+    "vel": "vel",
+    "mass": "mass",
+    "radius": "radius",
+    "static": "static",
+    "locked": "locked",
+    "anchor_selected": "selected",
+}
+SPRING_COLUMNS = {
+    "spring_uid": "uid",
+    # index into the anchor arrays
+    "start": "start",
+    "end": "end",
+    "law": "law",
+    "stiffness": "stiffness",
+    "rest_length": "rest_length",
+    "damping": "damping",
+    "max_force": "max_force",
+    "min_force": "min_force",
+    "spring_selected": "selected",
+}
+
+# An immutable copy of the state needed to draw a simulation.
+# The simulation publishes a new one by swapping a single reference,
+# so readers never see a half updated state and never have to lock.
+class Snapshot:
+    # number of steps simulated when this snapshot was taken
+    step: int
+    anchor_uid: np.ndarray
+    pos: np.ndarray
+    vel: np.ndarray
+    mass: np.ndarray
+    radius: np.ndarray
+    static: np.ndarray
+    locked: np.ndarray
+    anchor_selected: np.ndarray
+    spring_uid: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+    law: np.ndarray
+    stiffness: np.ndarray
+    rest_length: np.ndarray
+    damping: np.ndarray
+    max_force: np.ndarray
+    min_force: np.ndarray
+    spring_selected: np.ndarray
+
+    # Wraps the given arrays, which must not change anymore
+    def __init__(self, step: int, **columns):
+        self.step = step
+        for name, column in columns.items():
+            column.flags.writeable = False
+            setattr(self, name, column)
+
+    # Takes a snapshot of the current state of an engine
+    @classmethod
+    def of(cls, engine: Engine, step: int = 0) -> 'Snapshot':
+        n, m = engine.anchors.size, engine.springs.size
+        columns = {}
+        for name, column in ANCHOR_COLUMNS.items():
+            columns[name] = getattr(engine.anchors, column)[:n].copy()
+        for name, column in SPRING_COLUMNS.items():
+            columns[name] = getattr(engine.springs, column)[:m].copy()
+        return cls(step, **columns)
+
+    @property
+    def n_anchors(self) -> int:
+        return len(self.pos)
+
+    @property
+    def n_springs(self) -> int:
+        return len(self.start)
@@ -0,0 +1,127 @@
+from typing import Optional, Tuple
+import numpy as np
+from snapshot import Snapshot
+
+# side length of a cell of the index in world units
+CELL_SIZE = 0.5
+# half size of the square around a spring's midpoint which picks the spring
+SPRING_PICK_SIZE = 0.4
+
+# cell coordinates are clipped to this, so far away points share the border cells
+CELL_LIMIT = 1 << 30
+
+# Uniform grid over a set of world space points, stored as the point ids
+# sorted by the key of the cell they are in. The keys of a cell column are
+# contiguous, so a box is looked up with one binary search per column.
+class SpatialIndex:
+    cell: float
+    # point ids ordered by cell
+    order: np.ndarray
+    # cell key of each point in order
+    keys: np.ndarray
+    points: np.ndarray
+
+    def __init__(self, cell: float = CELL_SIZE):
+        self.cell = cell
+        self.order = np.zeros(0, dtype=np.intp)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.points = np.zeros((0, 2))
+
+    def cells(self, points: np.ndarray) -> np.ndarray:
+        # shifted to be positive, so truncating rounds down
+        cells = np.clip(points * (1 / self.cell) + CELL_LIMIT, 0, 2 * CELL_LIMIT - 1)
+        return cells.astype(np.int64)
+
+    def key(self, cells: np.ndarray) -> np.ndarray:
+        return (cells[..., 0] << 32) | cells[..., 1]
+
+    # Moves the points to their new positions. Points mostly stay in their cell
+    # between two frames, so the previous order is nearly sorted already and
+    # the stable sort only has to merge the few runs broken up by movement.
+    def update(self, points: np.ndarray):
+        self.points = points
+        if len(points) != len(self.order):
+            self.order = np.arange(len(points))
+        keys = self.key(self.cells(points[self.order]))
+        if np.array_equal(keys, self.keys):
+            return
+        resort = np.argsort(keys, kind="stable")
+        self.order = self.order[resort]
+        self.keys = keys[resort]
+
+    # ids of the points inside the box from lo to hi, in ascending order
+    def query(self, lo, hi) -> np.ndarray:
+        if len(self.keys) == 0:
+            return np.zeros(0, dtype=np.intp)
+        lo_cell, hi_cell = self.cells(np.array([lo, hi], dtype=float))
+        # only look at the columns which have points at all
+        columns = np.arange(max(lo_cell[0], self.keys[0] >> 32), min(hi_cell[0], self.keys[-1] >> 32) + 1, dtype=np.int64)
+        first = np.searchsorted(self.keys, (columns << 32) | lo_cell[1], side="left")
+        last = np.searchsorted(self.keys, (columns << 32) | hi_cell[1], side="right")
+
+        # concatenate the ranges first[i]:last[i] without a python loop
+        lengths = last - first
+        total = lengths.sum()
+        if total == 0:
+            return np.zeros(0, dtype=np.intp)
+        ends = np.cumsum(lengths)
+        slots = np.arange(total) + np.repeat(first - (ends - lengths), lengths)
+        ids = self.order[slots]
+
+        points = self.points[ids]
+        inside = np.all((points >= lo) & (points <= hi), axis=1)
+        return np.sort(ids[inside])
+
+# Spatial indices over the anchors and the spring midpoints of the latest snapshot,
+# used for picking entities with the mouse and box selection. The indices only
+# catch up with the snapshot when they are queried, so frames without clicks cost nothing.
+class Picker:
+    anchors: SpatialIndex
+    springs: SpatialIndex
+    snapshot: Optional[Snapshot]
+    # snapshot the indices were last updated with
+    indexed: Optional[Snapshot]
+
+    def __init__(self, cell: float = CELL_SIZE):
+        self.anchors = SpatialIndex(cell)
+        self.springs = SpatialIndex(cell)
+        self.snapshot = None
+        self.indexed = None
+
+    def update(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+
+    def refresh(self):
+        snapshot = self.snapshot
+        if snapshot is self.indexed:
+            return
+        self.indexed = snapshot
+        self.anchors.update(snapshot.pos)
+        self.springs.update(0.5 * (snapshot.pos[snapshot.start] + snapshot.pos[snapshot.end]))
+
+    # The entity at the given world point as (kind, uid), anchors before springs.
+    # Like Anchor.clicked and Spring.clicked, an entity is hit inside the square around it.
+    def pick(self, point) -> Optional[Tuple[str, int]]:
+        self.refresh()
+        snapshot = self.snapshot
+        point = np.array((point[0], point[1]), dtype=float)
+
+        reach = float(snapshot.radius.max()) if snapshot.n_anchors else 0
+        ids = self.anchors.query(point - reach, point + reach)
+        hit = np.all(np.abs(snapshot.pos[ids] - point) <= snapshot.radius[ids, None], axis=1)
+        if hit.any():
+            return "anchor", int(snapshot.anchor_uid[ids[np.argmax(hit)]])
+
+        ids = self.springs.query(point - SPRING_PICK_SIZE, point + SPRING_PICK_SIZE)
+        if len(ids):
+            return "spring", int(snapshot.spring_uid[ids[0]])
+        return None
+
+    # uids of the anchors and of the springs whose midpoint lies inside the box between a and b
+    def select_box(self, a, b) -> Tuple[np.ndarray, np.ndarray]:
+        self.refresh()
+        lo = np.minimum((a[0], a[1]), (b[0], b[1]))
+        hi = np.maximum((a[0], a[1]), (b[0], b[1]))
+        anchors = self.anchors.query(lo, hi)
+        springs = self.springs.query(lo, hi)
+        return self.snapshot.anchor_uid[anchors], self.snapshot.spring_uid[springs]
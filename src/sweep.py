@@ -0,0 +1,115 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from sim import Simulation
+from recorder import lookup
+import scene
+import numpy as np
+import itertools
+import copy
+
+# Parameters are given by name:
+#   "gravity"               vertical gravity, or a (x, y) pair
+#   "mass"                  mass of every non static anchor
+#   "stiffness"             stiffness of every spring, likewise "rest_length", "damping",
+#                           "max_force" and "min_force"
+#   "HookesSpring.stiffness" stiffness of every spring of the given type
+SPRING_FIELDS = ["stiffness", "rest_length", "damping", "max_force", "min_force"]
+
+# Every combination of the given parameter values
+def grid(**values) -> List[Dict[str, float]]:
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+# n parameter sets drawn uniformly from the given (low, high) ranges
+def sample(n: int, seed: Optional[int] = None, **ranges) -> List[Dict[str, float]]:
+    rng = np.random.default_rng(seed)
+    columns = {name: rng.uniform(low, high, n) for name, (low, high) in ranges.items()}
+    return [{name: float(column[i]) for name, column in columns.items()} for i in range(n)]
+
+# Applies a parameter set to a scene in the format of scene.to_dict
+def apply(base: dict, params: Dict[str, float]) -> dict:
+    result = copy.deepcopy(base)
+    for name, value in params.items():
+        if name == "gravity":
+            result["gravity"] = [0, value] if np.isscalar(value) else list(value)
+            result["gravity_enabled"] = True
+        elif name == "mass":
+            for anchor in result["anchors"]:
+                if not anchor.get("static", False):
+                    anchor["mass"] = value
+        else:
+            spring_type, _, field = name.rpartition(".")
+            if field not in SPRING_FIELDS:
+                raise ValueError(f"unknown parameter: {name}")
+            for spring in result["springs"]:
+                if spring_type in ("", spring["type"]):
+                    spring[field] = value
+    return result
+
+# Period and amplitude of a signal oscillating around its mean
+def oscillation(signal: np.ndarray, dt: float) -> Tuple[float, float]:
+    centered = signal - signal.mean()
+    # upward zero crossings
+    crossings = np.flatnonzero((centered[:-1] < 0) & (centered[1:] >= 0))
+    period = float(np.diff(crossings).mean() * dt) if len(crossings) > 1 else float("nan")
+    amplitude = float((signal.max() - signal.min()) / 2) if len(signal) else float("nan")
+    return period, amplitude
+
+# Simulates a scene for the given number of steps and reduces it to a few metrics.
+# The period and amplitude are taken from the given anchor (default: first non static one)
+# along the axis it moves the most.
+def run(base: dict, params: Dict[str, float], steps: int, anchor: Optional[int] = None) -> Dict[str, float]:
+    sim = Simulation()
+    scene.from_dict(sim, apply(base, params))
+    anchors = sim.engine.anchors
+    if anchor is None:
+        dynamic = np.flatnonzero(~anchors.static[:anchors.size])
+        anchor = int(dynamic[0]) if len(dynamic) else 0
+    # anchors are followed by uid, as their rows move when others get removed
+    uids = anchors.uid[:anchors.size].copy()
+
+    initial = anchors.pos[:anchors.size].copy()
+    rows = np.arange(len(uids))
+    size = len(uids)
+    history = np.full((steps + 1, 2), np.nan)
+    max_displacement = 0.0
+    for step in range(steps + 1):
+        if step > 0:
+            sim.update()
+        if anchors.size != size:
+            size = anchors.size
+            rows = lookup(uids, anchors.uid[:size])
+        found = rows >= 0
+        row = rows[anchor] if anchor < len(rows) else -1
+        if row >= 0:
+            history[step] = anchors.pos[row]
+        # of the anchors which are still there
+        delta = anchors.pos[rows[found]] - initial[found]
+        max_displacement = max(max_displacement, float(np.einsum("ij,ij->i", delta, delta).max(initial=0)))
+
+    history = history[~np.isnan(history[:, 0])]
+    axis = int(np.argmax(history.var(axis=0))) if len(history) else 0
+    period, amplitude = oscillation(history[:, axis], sim.timestep)
+    return {
+        "period": period,
+        "amplitude": amplitude,
+        "max_displacement": max_displacement ** 0.5,
+        "escaped": anchors.size != len(initial),
+    }
+
+def _run(job):
+    return run(*job)
+
+# Runs every parameter set on the base scene across a pool of processes,
+# returning (params, metrics) pairs in the order of the parameter sets
+def sweep(base: dict, params: List[Dict[str, float]], steps: int = 1000,
+          anchor: Optional[int] = None, workers: Optional[int] = None) -> List[Tuple[dict, dict]]:
+    jobs = [(base, p, steps, anchor) for p in params]
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        metrics = list(executor.map(_run, jobs, chunksize=chunksize))
+    return list(zip(params, metrics))
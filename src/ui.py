@@ -7,6 +7,12 @@ class SettingsUI:
     gravity_enabled: tp.Checkbox
     gravity_x_input: tp.TextInput
     gravity_y_input: tp.TextInput
+    speed_input: tp.TextInput
+    collisions_enabled: tp.Checkbox
+    restitution_input: tp.TextInput
+    sleeping_enabled: tp.Checkbox
+    forward_input: tp.TextInput
+    forward_until_rest: tp.Checkbox
     settings: tp.TitleBox
 
     def __init__(self, screen: pygame.Surface, sim: Simulation):
@@ -26,8 +32,36 @@ class SettingsUI:
         group = tp.Group([
             gravity_text, self.gravity_enabled, x_text, self.gravity_x_input, y_text, self.gravity_y_input, unit_text
         ], "h")
+        speed_text = tp.Text("Speed: ")
+        self.speed_input = tp.TextInput(str(self.sim.get_speed()), placeholder="speed")
+        self.speed_input.on_validation = self.update_speed
+        speed_unit = tp.Text("x real time")
+        speed = tp.Group([ speed_text, self.speed_input, speed_unit ], "h")
+        collisions_text = tp.Text("Collisions")
+        self.collisions_enabled = tp.Checkbox(self.sim.collisions)
+        self.collisions_enabled.at_unclick = self.update_collisions
+        restitution_text = tp.Text("Restitution: ")
+        self.restitution_input = tp.TextInput(str(self.sim.restitution), placeholder="restitution")
+        self.restitution_input.on_validation = self.update_restitution
+        collisions = tp.Group([ collisions_text, self.collisions_enabled, restitution_text, self.restitution_input ], "h")
+        sleeping_text = tp.Text("Sleep when at rest")
+        self.sleeping_enabled = tp.Checkbox(self.sim.sleeping)
+        self.sleeping_enabled.at_unclick = self.update_sleeping
+        sleeping = tp.Group([ sleeping_text, self.sleeping_enabled ], "h")
+        forward_text = tp.Text("Fast forward: ")
+        self.forward_input = tp.TextInput("10", placeholder="seconds")
+        forward_unit = tp.Text("s")
+        rest_text = tp.Text("until at rest")
+        self.forward_until_rest = tp.Checkbox(False)
+        forward_button = tp.Button("Go")
+        forward_button.at_unclick = self.fast_forward
+        forward = tp.Group([ forward_text, self.forward_input, forward_unit, rest_text, self.forward_until_rest, forward_button ], "h")
         self.settings = tp.TitleBox("Settings", [
             group,
+            speed,
+            collisions,
+            sleeping,
+            forward,
         ])
         self.settings_updater = self.settings.get_updater()
 
@@ -38,17 +72,42 @@ class SettingsUI:
         self.settings.center_on(screen)
 
     def update_gravity_enabled(self):
-        self.sim.gravity_enabled = not self.gravity_enabled.get_value()
+        self.sim.set_gravity_enabled(not self.gravity_enabled.get_value())
 
     def update_gravity_x(self):
         try:
-            self.sim.gravity.x = float(self.gravity_x_input.get_value())
+            self.sim.set_gravity((float(self.gravity_x_input.get_value()), self.sim.gravity.y))
         except:
             pass
     
     def update_gravity_y(self):
         try:
-            self.sim.gravity.y = float(self.gravity_y_input.get_value())
+            self.sim.set_gravity((self.sim.gravity.x, float(self.gravity_y_input.get_value())))
+        except:
+            pass
+
+    def update_speed(self):
+        try:
+            self.sim.set_speed(max(0, float(self.speed_input.get_value())))
+        except:
+            pass
+
+    def update_collisions(self):
+        self.sim.set_collisions(not self.collisions_enabled.get_value())
+
+    def update_sleeping(self):
+        self.sim.set_sleeping(not self.sleeping_enabled.get_value())
+
+    def fast_forward(self):
+        try:
+            seconds = max(0, float(self.forward_input.get_value()))
+        except:
+            return
+        self.sim.fast_forward(seconds, self.forward_until_rest.get_value(), wait=False)
+
+    def update_restitution(self):
+        try:
+            self.sim.set_restitution(min(1, max(0, float(self.restitution_input.get_value()))))
         except:
             pass
 
@@ -111,8 +170,21 @@ class SpringUI:
         stiffness_text = tp.Text("Stiffness: ")
         stiffness_unit = tp.Text("N/m")
         stiffness = tp.Group([ stiffness_text, self.stiffness_input, stiffness_unit ], "h")
+        self.rest_length_input = tp.TextInput(str(spring.rest_length), placeholder="rest length")
+        self.rest_length_input.on_validation = self.update_rest_length
+        rest_length_text = tp.Text("Rest length: ")
+        rest_length_unit = tp.Text("m")
+        rest_length = tp.Group([ rest_length_text, self.rest_length_input, rest_length_unit ], "h")
+        self.damping_input = tp.TextInput(str(spring.damping), placeholder="damping")
+        self.damping_input.on_validation = self.update_damping
+        damping_text = tp.Text("Damping: ")
+        damping_unit = tp.Text("Ns/m")
+        damping = tp.Group([ damping_text, self.damping_input, damping_unit ], "h")
+        # springs which aren't stretched have no rest length
         self.settings = tp.TitleBox("Spring Settings", [
             stiffness,
+            *([rest_length] if spring.stretched else []),
+            damping,
         ])
         self.updater = self.settings.get_updater()
         self._show = False
@@ -129,3 +201,15 @@ class SpringUI:
             self.spring.stiffness = float(self.stiffness_input.get_value())
         except:
             pass
+
+    def update_rest_length(self):
+        try:
+            self.spring.rest_length = max(0, float(self.rest_length_input.get_value()))
+        except:
+            pass
+
+    def update_damping(self):
+        try:
+            self.spring.damping = max(0, float(self.damping_input.get_value()))
+        except:
+            pass
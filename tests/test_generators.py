@@ -0,0 +1,62 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from sim import Simulation, HookesSpring, QuadraticSpring, ConstantSpring, HyperbolicSpring
+import generators
+import numpy as np
+import pytest
+
+SPRINGS = [HookesSpring, QuadraticSpring, ConstantSpring, HyperbolicSpring]
+# small structures of every generator
+STRUCTURES = {
+    "chain": {"links": 12, "row_length": 5},
+    "lattice": {"rows": 5, "cols": 6},
+    "triangular": {"rows": 5, "cols": 6, "triangular": True},
+    "cloth": {"rows": 6, "cols": 6, "bend": True},
+    "random": {"n": 30, "seed": 0},
+}
+
+def generate(sim: Simulation, name: str, **params):
+    kwargs = dict(STRUCTURES[name], **params)
+    return generators.GENERATORS["lattice" if name == "triangular" else name](sim, **kwargs)
+
+@pytest.mark.parametrize("spring", SPRINGS, ids=lambda cls: cls.__name__)
+@pytest.mark.parametrize("name", list(STRUCTURES))
+def test_generated_state_stays_finite(name, spring):
+    sim = Simulation()
+    sim.clear()
+    anchors, springs = generate(sim, name, spring=spring, stiffness=50, damping=0.5)
+    assert len(anchors) and len(springs)
+    engine = sim.engine
+    for _ in range(200):
+        sim.update()
+        n = engine.anchors.size
+        assert np.isfinite(engine.anchors.pos[:n]).all()
+        assert np.isfinite(engine.anchors.vel[:n]).all()
+
+@pytest.mark.parametrize("name", list(STRUCTURES))
+def test_springs_rest_at_built_length(name):
+    sim = Simulation()
+    sim.clear()
+    generate(sim, name, spring=SPRINGS)
+    engine = sim.engine
+    m = engine.springs.size
+    delta = engine.anchors.pos[engine.springs.end[:m]] - engine.anchors.pos[engine.springs.start[:m]]
+    stretched = np.array([cls.stretched for cls in SPRINGS])[np.arange(m) % len(SPRINGS)]
+    expected = np.where(stretched, np.hypot(delta[:, 0], delta[:, 1]), 0)
+    assert np.allclose(engine.springs.rest_length[:m], expected)
+    assert np.isfinite(engine.spring_forces(engine.anchors.pos[:engine.anchors.size])).all()
+
+    # springs resting at their length apply no force
+    sim.clear()
+    generate(sim, name, spring=[cls for cls in SPRINGS if cls.stretched])
+    force = engine.spring_forces(engine.anchors.pos[:engine.anchors.size])
+    assert np.allclose(force, 0, atol=1e-9)
+
+def test_rest_length_rejected_without_stretch():
+    sim = Simulation()
+    sim.clear()
+    with pytest.raises(ValueError):
+        generators.chain(sim, 3, spring=HyperbolicSpring, rest_length=1)